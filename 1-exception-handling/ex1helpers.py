@@ -1,3 +1,6 @@
+from array import array
+
+
 class NoMPIComm(object):
     def __init__(self):
         self.comm = None
@@ -31,14 +34,14 @@ class SafeMPIComm(object):
             # only root catches error here
             error = e
 
-        # check for error
-        error = self.comm.bcast(error, root=root)
+        # the error travels with the data in a single bcast
+        error, obj = self.comm.bcast((error, obj), root=root)
         # handle the error on all ranks
         if error is not None:
             msg = f"{self.rank}: caught error before bcast!"
             raise RuntimeError(msg) from error
 
-        return self.comm.bcast(obj, root=root)
+        return obj
 
     def gather(self, rankfunc, root=0):
         # all ranks call rankfunc
@@ -50,12 +53,7 @@ class SafeMPIComm(object):
             error = e
 
         # check for error
-        errors = self.comm.allgather(error)
-        # handle the error(s) on all ranks
-        for error in errors:
-            if error is not None:
-                msg = f"{self.rank}: caught error before gather"
-                raise RuntimeError(msg) from error
+        self._check(error, "gather")
 
         return self.comm.gather(sendobj, root=root)
 
@@ -69,11 +67,22 @@ class SafeMPIComm(object):
             error = e
 
         # check for error
-        errors = self.comm.allgather(error)
+        # the status check already synchronizes all ranks
+        self._check(error, "barrier")
+
+    def _check(self, error, where):
+        """Raises a RuntimeError on all ranks if any rank caught an error.
+
+        The ranks first agree on the number of failed ranks with a buffer-based Allreduce of a
+        single integer. The pickled errors are only gathered when that number is nonzero.
+        """
+        status = array("i", [0 if error is None else 1])
+        nfailed = array("i", [0])
+        self.comm.Allreduce(status, nfailed)
+        if nfailed[0] == 0:
+            return
         # handle the error(s) on all ranks
-        for error in errors:
+        for error in self.comm.allgather(error):
             if error is not None:
-                msg = f"{self.rank}: caught error before barrier"
+                msg = f"{self.rank}: caught error before {where}"
                 raise RuntimeError(msg) from error
-
-        self.comm.barrier()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""Benchmarks the IO coordinators over a grid of rank counts, payload sizes, IO latencies
+and task counts.
+
+A single configuration is measured with the run command, which is what the sweep command
+launches (under mpiexec for the mpi coordinators) for every point of the grid:
+
+    python benchmark.py run --coordinator parallel --ntasks 10 --size 1000
+    python benchmark.py sweep --ranks 1 2 4 8 --sizes 10 1000 --format csv
+
+Each run reports its wall time, throughput, the mean time ranks spend in each stage, and
+the idle fraction of every rank (the fraction of wall time not spent inside a read,
+process or write function). The sweep adds the speedup versus the NoMPIIOCoordinator
+with the same task parameters and writes JSON or CSV.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import shlex
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from helpers import (
+    NoMPIIOCoordinator,
+    SerialIOCoordinator,
+    ParallelIOCoordinator,
+    scatter,
+    reduce,
+)
+
+
+class BenchTask(object):
+    def __init__(self, index, size, io_latency, compute_latency):
+        """A task with configurable costs. Reading and writing each sleep for io_latency seconds.
+        Processing sleeps for compute_latency seconds per element, divided between workers.
+        """
+        self.index = index
+        self.size = size
+        self.io_latency = io_latency
+        self.compute_latency = compute_latency
+        self.busy = 0.0
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.busy += time.perf_counter() - start
+        return result
+
+    def load_data(self):
+        def load():
+            time.sleep(self.io_latency)
+            return np.arange(self.index * self.size, (self.index + 1) * self.size)
+
+        return self._timed(load)
+
+    def process_data(self, numbers, comm):
+        if comm is not None:
+            numbers = scatter(numbers, comm, root=0)
+
+        def compute():
+            time.sleep(self.compute_latency * len(numbers))
+            return numbers.sum()
+
+        subtotal = self._timed(compute)
+        if comm is not None:
+            return reduce(subtotal, comm, root=0)
+        return subtotal
+
+    def write_result(self, total):
+        return self._timed(time.sleep, self.io_latency)
+
+
+def run(args):
+    """Runs one configuration and prints a JSON record on rank 0."""
+    if args.coordinator == "nompi":
+        coordinator = NoMPIIOCoordinator()
+    else:
+        from mpi4py import MPI
+
+        if args.coordinator == "serial":
+            coordinator = SerialIOCoordinator(MPI.COMM_WORLD)
+        else:
+            coordinator = ParallelIOCoordinator(MPI.COMM_WORLD, prefetch=args.prefetch)
+    comm = coordinator.comm
+
+    stages = {"read": 0.0, "process": 0.0, "write": 0.0}
+    busy = 0.0
+
+    def timed(stage, step, func, payload):
+        start = time.perf_counter()
+        result = step(func, payload)
+        stages[stage] += time.perf_counter() - start
+        return result
+
+    if comm is not None:
+        comm.barrier()
+    start = time.perf_counter()
+    for i in range(args.ntasks):
+        task = BenchTask(i, args.size, args.io_latency, args.compute_latency)
+        numbers = timed("read", coordinator.read, task.load_data, None)
+        total = timed(
+            "process",
+            coordinator.process,
+            lambda: task.process_data(numbers, coordinator.work_comm),
+            None,
+        )
+        timed("write", coordinator.write, task.write_result, total)
+        busy += task.busy
+    coordinator.close()
+    if comm is not None:
+        comm.barrier()
+    wall = time.perf_counter() - start
+
+    record = {"stages": stages, "busy": busy}
+    records = [record] if comm is None else comm.gather(record, root=0)
+    if records is None:
+        return
+    nranks = len(records)
+    result = {
+        "coordinator": args.coordinator,
+        "ranks": nranks,
+        "ntasks": args.ntasks,
+        "size": args.size,
+        "io_latency": args.io_latency,
+        "compute_latency": args.compute_latency,
+        "prefetch": args.prefetch,
+        "wall": wall,
+        "throughput": args.ntasks / wall,
+    }
+    for stage in stages:
+        result[f"{stage}_time"] = sum(r["stages"][stage] for r in records) / nranks
+    result["idle_fraction"] = [1 - r["busy"] / wall for r in records]
+    print(json.dumps(result), flush=True)
+
+
+def sweep(args):
+    """Runs every configuration in the grid and writes the results as JSON or CSV."""
+    python = [sys.executable, __file__, "run"]
+    results = []
+    grid = itertools.product(
+        args.coordinators, args.ranks, args.sizes, args.io_latencies, args.ntasks
+    )
+    for coordinator, ranks, size, io_latency, ntasks in grid:
+        # nompi runs on exactly one process, parallel needs a reader, a writer and a worker
+        if (coordinator == "nompi") != (ranks == 1) or (coordinator == "parallel" and ranks < 3):
+            continue
+        options = [
+            f"--coordinator={coordinator}",
+            f"--ntasks={ntasks}",
+            f"--size={size}",
+            f"--io-latency={io_latency}",
+            f"--compute-latency={args.compute_latency}",
+            f"--prefetch={args.prefetch}",
+        ]
+        command = python + options
+        if coordinator != "nompi":
+            command = shlex.split(args.mpiexec) + ["-n", str(ranks)] + command
+        print(" ".join(command), file=sys.stderr)
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    # speedup versus the NoMPIIOCoordinator with the same task parameters
+    def key(r):
+        return (r["size"], r["io_latency"], r["ntasks"])
+
+    baselines = {key(r): r["wall"] for r in results if r["coordinator"] == "nompi"}
+    for r in results:
+        r["speedup"] = baselines[key(r)] / r["wall"] if key(r) in baselines else None
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    if args.format == "json":
+        json.dump(results, output, indent=2)
+        output.write("\n")
+    else:
+        writer = csv.DictWriter(output, fieldnames=list(results[0]) if results else [])
+        writer.writeheader()
+        for r in results:
+            idle = " ".join(f"{fraction:.3f}" for fraction in r["idle_fraction"])
+            writer.writerow(dict(r, idle_fraction=idle))
+    if args.output:
+        output.close()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run one configuration")
+    run_parser.add_argument(
+        "--coordinator", choices=["nompi", "serial", "parallel"], default="nompi"
+    )
+    run_parser.add_argument("--ntasks", type=int, default=10, help="number of tasks")
+    run_parser.add_argument("--size", type=int, default=10, help="elements per task")
+    run_parser.add_argument("--io-latency", type=float, default=0.1, help="seconds per read/write")
+    run_parser.add_argument(
+        "--compute-latency", type=float, default=0.001, help="seconds per element"
+    )
+    run_parser.add_argument("--prefetch", type=int, default=0, help="pipeline depth")
+
+    sweep_parser = subparsers.add_parser("sweep", help="run a grid of configurations")
+    sweep_parser.add_argument(
+        "--coordinators", nargs="+", default=["nompi", "serial", "parallel"]
+    )
+    sweep_parser.add_argument("--ranks", type=int, nargs="+", default=[1, 2, 4])
+    sweep_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000])
+    sweep_parser.add_argument("--io-latencies", type=float, nargs="+", default=[0.01, 0.1])
+    sweep_parser.add_argument("--ntasks", type=int, nargs="+", default=[10])
+    sweep_parser.add_argument("--compute-latency", type=float, default=0.001)
+    sweep_parser.add_argument("--prefetch", type=int, default=0, help="pipeline depth")
+    sweep_parser.add_argument("--mpiexec", default="mpiexec", help="mpi launcher command")
+    sweep_parser.add_argument("--format", choices=["json", "csv"], default="json")
+    sweep_parser.add_argument("--output", help="output file (default: stdout)")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sweep(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -36,11 +36,11 @@ def main():
         numbers = None
         if rank == 0:
             numbers = task.load_data(10)
-        # divide work between ranks and gather result on root
-        subtotals = task.divide_and_conquer(numbers, comm)
-        # sum subtotals and print result
+        # divide work between ranks and reduce result on root
+        total = task.divide_and_conquer(numbers, comm)
+        # print result
         if rank == 0:
-            task.write_result(subtotals)
+            task.write_result(total)
 
     if comm is not None:
         comm.barrier()
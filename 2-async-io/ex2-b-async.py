@@ -57,20 +57,20 @@ def main():
             elif rank == WORK_ROOT:
                 numbers = comm.recv(source=READ_RANK)
 
-        # divide work between ranks and gather result on root
-        subtotals = None
+        # divide work between ranks and reduce result on root
+        total = None
         if rank >= WORK_ROOT:
-            subtotals = task.divide_and_conquer(numbers, work_comm)
+            total = task.divide_and_conquer(numbers, work_comm)
 
         if args.async_io:
             if rank == WORK_ROOT:
-                comm.send(subtotals, dest=WRITE_RANK)
+                comm.send(total, dest=WRITE_RANK)
             elif rank == WRITE_RANK:
-                subtotals = comm.recv(source=WORK_ROOT)
+                total = comm.recv(source=WORK_ROOT)
 
-        # sum subtotals and print result
+        # print result
         if rank == WRITE_RANK:
-            task.write_result(subtotals)
+            task.write_result(total)
 
     if comm is not None:
         comm.barrier()
@@ -1,12 +1,24 @@
 #!/usr/bin/env python
 
 import argparse
+import functools
+import json
 
 from helpers import (
     Task,
     NoMPIIOCoordinator,
     SerialIOCoordinator,
     ParallelIOCoordinator,
+    DeferredResult,
+    TaskFailed,
+    divide_and_conquer_batch,
+    ResultCache,
+    StragglerMonitor,
+    CyclicPartitioner,
+    WeightedPartitioner,
+    StageTimer,
+    timing_summary,
+    chrome_trace,
 )
 
 
@@ -18,40 +30,180 @@ def main():
     parser.add_argument("--trigger-two", action="store_true", help="raise error")
     parser.add_argument("--trigger-three", action="store_true", help="raise error")
     parser.add_argument("--async-io", action="store_true", help="async io")
+    parser.add_argument("--prefetch", type=int, default=0, help="pipeline depth")
+    parser.add_argument("--ngroups", type=int, default=1, help="number of worker groups")
+    parser.add_argument("--nreaders", type=int, default=1, help="number of reader ranks")
+    parser.add_argument("--nwriters", type=int, default=1, help="number of writer ranks")
+    parser.add_argument(
+        "--background-io", action="store_true", help="overlap io using threads"
+    )
+    parser.add_argument("--timing", help="write a chrome trace of stage timings to this file")
+    parser.add_argument("--chunk-size", type=int, default=0, help="stream input in chunks")
+    parser.add_argument(
+        "--layout",
+        choices=["strided", "contiguous", "block-cyclic", "shared"],
+        default="strided",
+        help="how input is divided between workers",
+    )
+    parser.add_argument(
+        "--block-size", type=int, default=2, help="items per block of the block-cyclic layout"
+    )
+    parser.add_argument(
+        "--weights", type=float, nargs="+", help="divide input in proportion to these per-rank speeds"
+    )
+    parser.add_argument("--cache", help="directory to cache task results in")
+    parser.add_argument(
+        "--cache-size", type=int, default=2**30, help="maximum bytes of cached results"
+    )
+    parser.add_argument("--ntasks", type=int, default=3, help="number of tasks")
+    parser.add_argument(
+        "--batch-size", type=int, default=1, help="tasks to send in one message per stage"
+    )
+    parser.add_argument("--stragglers", action="store_true", help="report slow worker ranks")
+    parser.add_argument(
+        "--rebalance", action="store_true", help="give slow worker ranks less work"
+    )
+    parser.add_argument("--slow-rank", type=int, default=None, help="rank to slow down")
+    parser.add_argument("--slowdown", type=float, default=3.0, help="how much to slow it down")
     args = parser.parse_args()
+    if args.weights and args.layout == "shared":
+        parser.error("--weights does not work with --layout shared")
+    if args.batch_size > 1:
+        unbatched = [args.chunk_size > 0, args.cache, args.background_io, args.stragglers]
+        if any(unbatched) or args.rebalance or args.layout == "shared":
+            parser.error(
+                "--batch-size does not work with --chunk-size, --cache, --background-io, "
+                "--stragglers, --rebalance or --layout shared"
+            )
+    if args.chunk_size > 0 and args.cache:
+        # the cache key depends on the whole input, which a stream never holds at once
+        parser.error("--chunk-size does not work with --cache")
+    if args.rebalance and (args.weights or args.layout == "block-cyclic"):
+        # rebalancing picks its own weighted blocks, which would replace these
+        parser.error("--rebalance does not work with --weights or --layout block-cyclic")
+
+    layout = args.layout
+    if args.layout == "block-cyclic":
+        layout = CyclicPartitioner(args.block_size)
+    if args.weights:
+        layout = WeightedPartitioner(args.weights)
+
+    timer = StageTimer() if args.timing else None
+    cache = None
+    if args.cache:
+        # results only depend on the input and how it is processed
+        cache = ResultCache(args.cache, max_bytes=args.cache_size, params="divide_and_conquer")
 
     # optional mpi setup
     if args.mpi:
         from mpi4py import MPI
 
         if args.async_io:
-            coordinator = ParallelIOCoordinator(MPI.COMM_WORLD)
+            coordinator = ParallelIOCoordinator(
+                MPI.COMM_WORLD,
+                prefetch=args.prefetch,
+                ngroups=args.ngroups,
+                nreaders=args.nreaders,
+                nwriters=args.nwriters,
+                timer=timer,
+                cache=cache,
+            )
         else:
-            coordinator = SerialIOCoordinator(MPI.COMM_WORLD)
+            coordinator = SerialIOCoordinator(MPI.COMM_WORLD, args.background_io, timer, cache)
     else:
-        coordinator = NoMPIIOCoordinator()
+        coordinator = NoMPIIOCoordinator(args.background_io, timer, cache)
     rank, size = coordinator.rank, coordinator.size
 
+    monitor = None
+    if args.stragglers or args.rebalance:
+        monitor = StragglerMonitor(rebalance=args.rebalance)
+
     # say hello
     print(f"{rank}: Hello!")
     if coordinator.comm is not None:
         coordinator.comm.barrier()
 
-    # iterate over tasks
-    for i in range(3):
-        task = Task(rank, size, i, args)
-        # generate data
-        numbers = coordinator.read(lambda: task.load_data(10), None)
-        # divide work between ranks and gather result on root
-        subtotals = coordinator.process(
-            lambda: task.divide_and_conquer(numbers, coordinator.work_comm), None
+    def read_async(task):
+        if args.chunk_size > 0:
+            # chunks are received while processing so there is nothing to read ahead
+            chunks = functools.partial(task.load_chunks, 10, args.chunk_size)
+            return DeferredResult(lambda: coordinator.read_stream(chunks, None))
+        return coordinator.read_async(lambda: task.load_data(10), None)
+
+    def divide_and_conquer(task, numbers):
+        if args.chunk_size > 0:
+            return task.divide_and_conquer_stream(
+                numbers, coordinator.work_comm, layout, monitor=monitor
+            )
+        return task.divide_and_conquer(
+            numbers, coordinator.work_comm, layout, monitor=monitor
         )
-        # sum subtotals and print result
-        coordinator.write(lambda r: task.write_result(r), subtotals)
+
+    # iterate over tasks
+    tasks = [Task(rank, size, i, args) for i in range(args.ntasks)]
+    for task in tasks:
+        if rank == args.slow_rank:
+            task.slowdown = args.slowdown
+    if args.batch_size > 1:
+        run_batches(coordinator, tasks, args.batch_size, layout)
+    else:
+        pending = read_async(tasks[0])
+        for i, task in enumerate(tasks):
+            # generate data
+            numbers = pending.result()
+            # request the next task's data before processing this one
+            if i + 1 < len(tasks):
+                pending = read_async(tasks[i + 1])
+            # divide work between ranks and reduce result on root
+            total = coordinator.process(lambda: divide_and_conquer(task, numbers), None)
+            # print result, a failed task arrives at the writer in place of its result
+            try:
+                coordinator.write(task.write_result, total)
+            except TaskFailed as e:
+                print(f"{rank}: ({e.failure.index}) skipping -> {e}")
+
+    # background writes that failed after their task moved on are reported on close
+    while True:
+        try:
+            coordinator.close()
+            break
+        except TaskFailed as e:
+            print(f"{rank}: ({e.failure.index}) skipping -> {e}")
+
+    # summarize stage timings on rank 0
+    if timer is not None:
+        events = timer.gather(coordinator.comm)
+        if events is not None:
+            print(timing_summary(events))
+            with open(args.timing, "w") as f:
+                json.dump(chrome_trace(events), f)
 
     if coordinator.comm is not None:
         coordinator.comm.barrier()
 
 
+def run_batches(coordinator, tasks, batch_size, layout):
+    """Runs the tasks in batches of batch_size. Each stage handles a whole batch with one
+    message or collective round, and the failure of each task travels with its data, so one
+    bad task doesn't fail the rest of its batch.
+    """
+    for first in range(0, len(tasks), batch_size):
+        batch = tasks[first : first + batch_size]
+        indices = [task.index for task in batch]
+        # generate data for the whole batch, an error only fails its own task
+        numbers = coordinator.read_batch(indices, lambda i: tasks[i].load_data(10), None)
+        # divide work between ranks and reduce results on root, one round for all tasks
+        totals = coordinator.process(
+            lambda: divide_and_conquer_batch(batch, numbers, coordinator.work_comm, layout),
+            None,
+        )
+        # print results, each failed task is skipped on its own
+        failures = coordinator.write_batch(
+            indices, lambda i, total: tasks[i].write_result(total), totals
+        )
+        for failure in failures:
+            print(f"{coordinator.rank}: ({failure.index}) skipping -> {failure}")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import argparse
+
+from helpers import (
+    Task,
+    TaskFailure,
+    NoMPITaskScheduler,
+    DynamicTaskScheduler,
+)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("--mpi", action="store_true", help="use mpi")
+    parser.add_argument("--trigger-one", action="store_true", help="raise error")
+    parser.add_argument("--trigger-two", action="store_true", help="raise error")
+    parser.add_argument("--trigger-three", action="store_true", help="raise error")
+    parser.add_argument("--ntasks", type=int, default=8, help="number of tasks")
+    parser.add_argument("--group-size", type=int, default=1, help="ranks per task")
+    parser.add_argument(
+        "--schedule", choices=["guided", "static"], default="guided", help="chunk sizing"
+    )
+    args = parser.parse_args()
+
+    # optional mpi setup
+    if args.mpi:
+        from mpi4py import MPI
+
+        scheduler = DynamicTaskScheduler(
+            MPI.COMM_WORLD, group_size=args.group_size, schedule=args.schedule
+        )
+    else:
+        scheduler = NoMPITaskScheduler()
+    rank, size = scheduler.rank, scheduler.size
+
+    # say hello
+    print(f"{rank}: Hello!")
+    if scheduler.comm is not None:
+        scheduler.comm.barrier()
+
+    # each task is read, processed and written by the group it is handed to
+    def run_task(i, work_comm):
+        task = Task(rank, size, i, args)
+        # task sizes are skewed so some tasks take 4x longer than others
+        numbers = None
+        if work_comm is None or work_comm.rank == 0:
+            try:
+                numbers = task.load_data(10 * (1 + i % 4))
+            except Exception as e:
+                if work_comm is None:
+                    raise
+                # the failure is scattered in place of the input, so the group fails together
+                numbers = TaskFailure(i, "read", rank, e)
+        # divide work between group ranks and reduce result on group root
+        total = task.divide_and_conquer(numbers, work_comm)
+        # print result
+        if work_comm is None or work_comm.rank == 0:
+            task.write_result(total)
+
+    # iterate over tasks in whatever order workers become idle
+    scheduler.run(run_task, args.ntasks)
+
+    if scheduler.comm is not None:
+        scheduler.comm.barrier()
+
+
+if __name__ == "__main__":
+    main()
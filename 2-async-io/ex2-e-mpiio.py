@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from helpers import (
+    Task,
+    NoMPIIOCoordinator,
+    CollectiveIOCoordinator,
+    CyclicPartitioner,
+)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("--mpi", action="store_true", help="use mpi")
+    parser.add_argument("--trigger-one", action="store_true", help="raise error")
+    parser.add_argument("--trigger-two", action="store_true", help="raise error")
+    parser.add_argument("--trigger-three", action="store_true", help="raise error")
+    parser.add_argument("--ntasks", type=int, default=3, help="number of tasks")
+    parser.add_argument("--dir", help="directory for the data files (default: a temp dir)")
+    parser.add_argument(
+        "--layout",
+        choices=["strided", "contiguous", "block-cyclic"],
+        default="strided",
+        help="which items of the input file each rank reads",
+    )
+    parser.add_argument(
+        "--block-size", type=int, default=2, help="items per block of the block-cyclic layout"
+    )
+    args = parser.parse_args()
+
+    layout = args.layout
+    if args.layout == "block-cyclic":
+        layout = CyclicPartitioner(args.block_size)
+
+    # optional mpi setup
+    if args.mpi:
+        from mpi4py import MPI
+
+        coordinator = CollectiveIOCoordinator(MPI.COMM_WORLD)
+    else:
+        coordinator = NoMPIIOCoordinator()
+    comm = coordinator.comm
+    rank, size = coordinator.rank, coordinator.size
+
+    # say hello
+    print(f"{rank}: Hello!")
+
+    # rank 0 writes the input of all tasks to a shared file
+    n = 10
+    dirname = None
+    if rank == 0:
+        dirname = args.dir or tempfile.mkdtemp()
+        np.arange(args.ntasks * n, dtype=np.int64).tofile(os.path.join(dirname, "input.bin"))
+    if comm is not None:
+        dirname = comm.bcast(dirname, root=0)
+    input_path = os.path.join(dirname, "input.bin")
+    output_path = os.path.join(dirname, "output.bin")
+
+    # iterate over tasks
+    for i in range(args.ntasks):
+        task = Task(rank, size, i, args)
+        # every rank reads its own numbers
+        numbers = coordinator.read(lambda: task.load_slice(input_path, comm, n, layout), None)
+        # every rank computes a subtotal
+        subtotal = coordinator.process(lambda: task.process_data(numbers), None)
+        # every rank writes its own subtotal
+        coordinator.write(lambda subtotal: task.write_slice(output_path, comm, subtotal), subtotal)
+
+    coordinator.close()
+    if comm is not None:
+        comm.barrier()
+
+    # rank 0 sums the subtotals of each task from the output file
+    if rank == 0:
+        subtotals = np.fromfile(output_path, dtype=np.int64).reshape(args.ntasks, size)
+        for i, total in enumerate(subtotals.sum(axis=1)):
+            print(f"{rank}: ({i}) total = {total}")
+        if args.dir is None:
+            shutil.rmtree(dirname)
+
+
+if __name__ == "__main__":
+    main()
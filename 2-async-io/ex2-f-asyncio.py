@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import argparse
+import asyncio
+
+from helpers import (
+    Task,
+    NoMPIAsyncioCoordinator,
+    AsyncioCoordinator,
+)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("--mpi", action="store_true", help="use mpi")
+    parser.add_argument("--trigger-one", action="store_true", help="raise error")
+    parser.add_argument("--trigger-two", action="store_true", help="raise error")
+    parser.add_argument("--trigger-three", action="store_true", help="raise error")
+    parser.add_argument("--ntasks", type=int, default=6, help="number of tasks")
+    parser.add_argument("--nreaders", type=int, default=1, help="number of reader ranks")
+    parser.add_argument("--nwriters", type=int, default=1, help="number of writer ranks")
+    parser.add_argument("--window", type=int, default=4, help="tasks read ahead per reader")
+    args = parser.parse_args()
+
+    # optional mpi setup
+    if args.mpi:
+        from mpi4py import MPI
+
+        coordinator = AsyncioCoordinator(
+            MPI.COMM_WORLD, nreaders=args.nreaders, nwriters=args.nwriters, window=args.window
+        )
+    else:
+        coordinator = NoMPIAsyncioCoordinator(window=args.window)
+    rank, size = coordinator.rank, coordinator.size
+
+    # say hello
+    print(f"{rank}: Hello!")
+    if coordinator.comm is not None:
+        coordinator.comm.barrier()
+
+    tasks = [Task(rank, size, i, args) for i in range(args.ntasks)]
+
+    # each stage only runs on the ranks of its role, so no dummy payloads are needed
+    def read(i):
+        # reads run on a thread pool, so several tasks are read at once
+        return tasks[i].load_data(10)
+
+    def process(i, numbers):
+        # divide work between worker ranks and reduce result on worker root
+        return tasks[i].divide_and_conquer(numbers, coordinator.work_comm)
+
+    def write(i, total):
+        tasks[i].write_result(total)
+
+    failures = asyncio.run(coordinator.run(args.ntasks, read, process, write))
+    for failure in failures:
+        print(f"{rank}: ({failure.index}) skipping -> {failure}")
+
+    if coordinator.comm is not None:
+        coordinator.comm.barrier()
+
+
+if __name__ == "__main__":
+    main()
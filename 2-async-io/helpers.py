@@ -1,5 +1,16 @@
 # - use time module to inject latency in toy problem
+import asyncio
+import functools
+import hashlib
+import inspect
+import operator
+import os
+import pickle
 import time
+import traceback
+from contextvars import ContextVar
+
+import numpy as np
 
 
 class Task(object):
@@ -10,6 +21,8 @@ class Task(object):
         self.trigger_one = args.trigger_one
         self.trigger_two = args.trigger_two
         self.trigger_three = args.trigger_three
+        # how many times slower than normal this rank processes
+        self.slowdown = 1.0
 
     def msg(self, s):
         return f"{self.rank}: ({self.index}) {s}"
@@ -18,7 +31,27 @@ class Task(object):
         time.sleep(0.5)
         if self.trigger_one and self.index == 1:
             raise RuntimeError(self.msg(f"error during load_data!"))
-        numbers = list(range((self.index * n), (self.index + 1) * n))
+        numbers = np.arange(self.index * n, (self.index + 1) * n)
+        print(self.msg(f"numbers = {numbers}"))
+        return numbers
+
+    def load_chunks(self, n, chunk_size):
+        """Yields the numbers of load_data(n) in chunks of at most chunk_size numbers."""
+        if self.trigger_one and self.index == 1:
+            raise RuntimeError(self.msg(f"error during load_data!"))
+        stop = (self.index + 1) * n
+        for start in range(self.index * n, stop, chunk_size):
+            time.sleep(0.5 * chunk_size / n)
+            numbers = np.arange(start, min(start + chunk_size, stop))
+            print(self.msg(f"chunk = {numbers}"))
+            yield numbers
+
+    def load_slice(self, path, comm, n, layout="strided"):
+        time.sleep(0.5)
+        if self.trigger_one and self.index == 1:
+            raise RuntimeError(self.msg(f"error during load_data!"))
+        # each rank reads only its own share of the task
+        numbers = read_all(path, comm, n, np.int64, offset=self.index * n, layout=layout)
         print(self.msg(f"numbers = {numbers}"))
         return numbers
 
@@ -26,62 +59,1157 @@ class Task(object):
         if self.trigger_two and self.index == 1:
             if self.rank == self.size - 1:
                 raise RuntimeError(self.msg(f"error during process_data!"))
-        subtotal = 0
-        for value in numbers:
-            time.sleep(0.1)
-            subtotal += value
+        time.sleep(0.1 * len(numbers) * self.slowdown)
+        subtotal = numbers.sum()
         print(self.msg(f"subtotal = {subtotal}"))
         return subtotal
 
-    def write_result(self, subtotals):
+    def write_result(self, total):
         time.sleep(0.5)
         if self.trigger_three and self.index == 1:
             raise RuntimeError(self.msg(f"error during write_result!"))
-        total = sum(subtotals)
         print(self.msg(f"total = {total}"))
 
-    def divide_and_conquer(self, numbers, comm):
-        # broadcast data
+    def write_slice(self, path, comm, subtotal):
+        time.sleep(0.5)
+        if self.trigger_three and self.index == 1:
+            raise RuntimeError(self.msg(f"error during write_result!"))
+        # each rank writes its subtotal to its own slot of the task's row
+        offset = self.index * self.size
+        write_all(path, np.array([subtotal]), comm, self.size, offset, layout="contiguous")
+        print(self.msg(f"wrote subtotal = {subtotal}"))
+
+    def process_share(self, numbers, comm, layout="strided", monitor=None):
+        if comm is None:
+            return self.process_data(numbers)
+        # slow ranks get a smaller share once the monitor knows how fast each rank is. the
+        # weighted blocks replace layout, so a rebalancing monitor needs a strided,
+        # contiguous or shared layout
+        weights = None if monitor is None else monitor.weights()
+        partitioner = "strided" if layout == "shared" else layout
+        if weights is not None:
+            partitioner = WeightedPartitioner(weights)
+        if layout == "shared":
+            # one copy of the data per node, each rank reads its share in place
+            with SharedArray(numbers, comm, root=0) as shared:
+                share = _partitioner(partitioner).share(shared.array, comm.rank, comm.size)
+                return self._measured(share, monitor)
+        # scatter data
+        numbers = scatter(numbers, comm, root=0, layout=partitioner)
+        return self._measured(numbers, monitor)
+
+    def _measured(self, numbers, monitor):
+        if monitor is None:
+            return self.process_data(numbers)
+        with monitor.measure(len(numbers)):
+            return self.process_data(numbers)
+
+    def divide_and_conquer(self, numbers, comm, layout="strided", combine=None, monitor=None):
+        # each rank computes a subtotal of its share
+        subtotal, failure = self._attempt_share(numbers, comm, layout, monitor)
+        self._update(monitor, comm)
+        # combine subtotals on root
         if comm is not None:
-            numbers = comm.bcast(numbers, root=0)
-            numbers = numbers[comm.rank :: comm.size]
-        # each rank computes a subtotal
-        subtotal = self.process_data(numbers)
-        # gather subtotals
+            self._agree(failure, comm)
+            return reduce(subtotal, comm, root=0, combine=combine)
+        return subtotal
+
+    def divide_and_conquer_stream(self, chunks, comm, layout="strided", monitor=None):
+        # the root pulls one chunk at a time, so only one chunk is held at once
+        is_root = comm is None or comm.rank == 0
+        subtotal = 0
+        failure = None
+        while True:
+            numbers = next(chunks, None) if is_root else None
+            # tell the other ranks whether there is another chunk, or that the task failed
+            more = numbers if isinstance(numbers, TaskFailure) else numbers is not None
+            if comm is not None:
+                with _waiting():
+                    more = comm.bcast(more, root=0)
+            if isinstance(more, TaskFailure):
+                raise TaskFailed(more)
+            if not more:
+                break
+            # accumulate the subtotals of this rank's share of each chunk. a rank that failed
+            # still takes its share of the remaining chunks, so the scatters stay matched
+            share, error = self._attempt_share(numbers, comm, layout, monitor)
+            subtotal = subtotal + share
+            failure = failure or error
+        # the monitor adds up the chunks, so it sees the whole task once
+        self._update(monitor, comm)
+        # combine subtotals on root
         if comm is not None:
-            subtotals = comm.gather(subtotal, root=0)
-        else:
-            subtotals = [
-                subtotal,
+            self._agree(failure, comm)
+            return reduce(subtotal, comm, root=0)
+        return subtotal
+
+    def _update(self, monitor, comm):
+        if comm is not None and monitor is not None:
+            stragglers = monitor.update(comm)
+            if stragglers and comm.rank == 0:
+                print(self.msg(f"stragglers = {stragglers}"))
+
+    def _attempt_share(self, numbers, comm, layout="strided", monitor=None):
+        """Returns (subtotal, None), or (0, TaskFailure) if processing this rank's share raised.
+
+        Without comm the error is raised as is. Otherwise the rank has to keep taking part in
+        the collectives of the task, since the other ranks only learn about the failure in
+        _agree().
+        """
+        try:
+            return self.process_share(numbers, comm, layout, monitor), None
+        except (TaskFailed, TaskCached):
+            # envelopes are raised on all ranks alike
+            raise
+        except Exception as e:
+            if comm is None:
+                raise
+            return 0, TaskFailure(self.index, "process", self.rank, e)
+
+    def _agree(self, failure, comm):
+        """Raises TaskFailed on all ranks of comm if processing failed on any of them, so they
+        skip the reduce together instead of waiting in it for the failed rank.
+        """
+        (failure,) = agree_failures([failure], comm)
+        if failure is not None:
+            raise TaskFailed(failure)
+
+
+def divide_and_conquer_batch(tasks, data, comm, layout="strided"):
+    """Processes a batch of tasks with one scatter_batch(), one status check and one Reduce,
+    instead of one round of each per task. A task that failed to load or process only fails
+    itself: its TaskFailure takes the place of its total.
+
+    Args:
+        tasks: the Task of each task in the batch, on all ranks.
+        data: on root, the input or TaskFailure of each task. ignored on other ranks.
+        comm: an MPI communicator or None.
+        layout: a Partitioner or the name of one, as in scatter().
+
+    Returns:
+        results: on root, the total or TaskFailure of each task. None on other ranks.
+    """
+    shares = data if comm is None else scatter_batch(data, comm, root=0, layout=layout)
+    subtotals = []
+    failures = []
+    for task, share in zip(tasks, shares):
+        failure = share if isinstance(share, TaskFailure) else None
+        if failure is None:
+            try:
+                subtotals.append(task.process_data(share))
+            except Exception as e:
+                failure = TaskFailure(task.index, "process", task.rank, e)
+        if failure is not None:
+            subtotals.append(0)
+        failures.append(failure)
+    if comm is None:
+        return [failure or subtotal for failure, subtotal in zip(failures, subtotals)]
+    # agree on the failed tasks, then sum the subtotals of all tasks at once
+    failures = agree_failures(failures, comm)
+    totals = reduce(np.asarray(subtotals), comm, root=0)
+    if totals is None:
+        return None
+    return [failure or total for failure, total in zip(failures, totals)]
+
+
+# the (timer, span) of the work span open in this thread, see StageTimer
+_open_span = ContextVar("_open_span", default=None)
+
+
+def _waiting():
+    """Returns a context manager that records the time in a collective as wait, if it is
+    called inside a timed work span. Otherwise it does nothing.
+    """
+    open_span = _open_span.get()
+    if open_span is None:
+        return _UNTIMED
+    timer, span = open_span
+    return timer.waiting(span)
+
+
+def _collective(func):
+    """Decorates a helper that communicates with all ranks of a communicator, so the time
+    spent in it is recorded as wait instead of work.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _waiting():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def is_array(obj):
+    """Returns True if obj is a NumPy array that can be communicated as a buffer."""
+    return isinstance(obj, np.ndarray)
+
+
+def send(obj, comm, dest, tag=0):
+    """Sends obj to dest. NumPy arrays are sent as a small pickled header with their dtype and
+    shape followed by the raw buffer, so the data is never pickled. Other objects are pickled
+    in the header. Receive with recv().
+    """
+    if is_array(obj):
+        obj = np.ascontiguousarray(obj)
+        comm.send(((obj.dtype.str, obj.shape), None), dest=dest, tag=tag)
+        comm.Send(obj, dest=dest, tag=tag)
+    else:
+        comm.send((None, obj), dest=dest, tag=tag)
+
+
+def isend(obj, comm, dest, tag=0, synchronous=False):
+    """Starts a nonblocking send(). Returns the list of requests that complete the send.
+    With synchronous=True, the requests only complete once the receive has started.
+    """
+    pickled, buffered = (comm.issend, comm.Issend) if synchronous else (comm.isend, comm.Isend)
+    if is_array(obj):
+        obj = np.ascontiguousarray(obj)
+        return [
+            pickled(((obj.dtype.str, obj.shape), None), dest=dest, tag=tag),
+            buffered(obj, dest=dest, tag=tag),
+        ]
+    return [pickled((None, obj), dest=dest, tag=tag)]
+
+
+def recv(comm, source, tag=0):
+    """Receives an object sent with send() or isend()."""
+    spec, obj = comm.recv(source=source, tag=tag)
+    if spec is not None:
+        dtype, shape = spec
+        obj = np.empty(shape, dtype=dtype)
+        comm.Recv(obj, source=source, tag=tag)
+    return obj
+
+
+def decompose(n, size, weights=None):
+    """Returns the per-rank counts and displacements for dividing n items between size ranks.
+
+    The counts are the same for the strided (items rank, rank + size, ...) and contiguous
+    (one block per rank) layouts, so the same counts and displacements describe both.
+    With weights, the counts are proportional to the weight of each rank instead.
+    """
+    if weights is None:
+        counts = [n // size + (1 if rank < n % size else 0) for rank in range(size)]
+    else:
+        # largest remainder rounding, so the counts add up to n
+        shares = [n * weight / sum(weights) for weight in weights]
+        counts = [int(share) for share in shares]
+        order = sorted(range(size), key=lambda rank: counts[rank] - shares[rank])
+        for rank in order[: n - sum(counts)]:
+            counts[rank] += 1
+    displs = [sum(counts[:rank]) for rank in range(size)]
+    return counts, displs
+
+
+@_collective
+def scatter(data, comm, root=0, layout="strided"):
+    """Scatters data from root so each rank receives only its own share.
+
+    NumPy arrays are sent with a buffer-based Scatterv, using the counts and displacements
+    of the partitioner directly. Partitioners that give each rank a block of consecutive
+    items send from the root's array without a copy; the others pack the shares into one
+    contiguous send buffer on root first. Other payloads fall back to a pickle-based
+    scatter of per-rank slices.
+
+    Args:
+        data: the data to scatter on root, or a TaskFailure or CacheHit that is raised as
+            TaskFailed or TaskCached on all ranks. ignored on other ranks.
+        comm: an MPI communicator.
+        root: the rank that holds data.
+        layout: a Partitioner, the same on all ranks, or the name of one: "strided" to give
+            rank r the items r, r + size, ... or "contiguous" to give each rank one block of
+            consecutive items.
+
+    Returns:
+        result: this rank's share of data.
+    """
+    partitioner = _partitioner(layout)
+    # agree on the path with a small header, a failed or cached task sends its envelope instead
+    header = None
+    if comm.rank == root and _is_envelope(data):
+        header = data
+    elif comm.rank == root and is_array(data):
+        header = (data.dtype.str, len(data))
+    header = comm.bcast(header, root=root)
+    _raise_envelope(header)
+    if header is None:
+        chunks = None
+        if comm.rank == root:
+            chunks = [partitioner.share(data, rank, comm.size) for rank in range(comm.size)]
+        return comm.scatter(chunks, root=root)
+
+    dtype, n = header
+    counts, displs = partitioner.decompose(n, comm.size)
+    sendbuf = None
+    if comm.rank == root:
+        indices = partitioner.indices(n, comm.size)
+        if indices is not None:
+            # pack the shares one after another
+            data = data[indices]
+        sendbuf = [np.ascontiguousarray(data), (counts, displs)]
+    recvbuf = np.empty(counts[comm.rank], dtype=dtype)
+    comm.Scatterv(sendbuf, recvbuf, root=root)
+    return recvbuf
+
+
+@_collective
+def scatter_batch(data, comm, root=0, layout="strided"):
+    """Scatters the inputs of a batch of tasks from root with one bcast and one Scatterv,
+    instead of one round of each per task. Each task is divided by the partitioner on its
+    own, and the shares of all tasks for a rank are sent as one block.
+
+    Args:
+        data: on root, a 1-d NumPy array or a TaskFailure per task. the arrays must have the
+            same dtype. ignored on other ranks.
+        comm: an MPI communicator.
+        root: the rank that holds data.
+        layout: a Partitioner, the same on all ranks, or the name of one, as in scatter().
+
+    Returns:
+        shares: this rank's share of each task, or the TaskFailure of a failed task.
+    """
+    partitioner = _partitioner(layout)
+    # the failures travel with the task sizes in a single bcast
+    header = None
+    if comm.rank == root:
+        dtype = next((d.dtype.str for d in data if not isinstance(d, TaskFailure)), None)
+        header = (dtype, [d if isinstance(d, TaskFailure) else len(d) for d in data])
+    dtype, sizes = comm.bcast(header, root=root)
+
+    counts = [
+        [0] * comm.size if isinstance(n, TaskFailure) else partitioner.decompose(n, comm.size)[0]
+        for n in sizes
+    ]
+    recvbuf = None
+    if dtype is not None:
+        totals = [sum(task_counts[rank] for task_counts in counts) for rank in range(comm.size)]
+        sendbuf = None
+        if comm.rank == root:
+            # pack the shares of all tasks for each rank one after another
+            shares = [
+                partitioner.share(d, rank, comm.size)
+                for rank in range(comm.size)
+                for d in data
+                if not isinstance(d, TaskFailure)
             ]
-        return subtotals
+            displs = [sum(totals[:rank]) for rank in range(comm.size)]
+            sendbuf = [np.ascontiguousarray(np.concatenate(shares)), (totals, displs)]
+        recvbuf = np.empty(totals[comm.rank], dtype=dtype)
+        comm.Scatterv(sendbuf, recvbuf, root=root)
+
+    # split this rank's block back into tasks
+    shares = []
+    start = 0
+    for n, task_counts in zip(sizes, counts):
+        if isinstance(n, TaskFailure):
+            shares.append(n)
+            continue
+        stop = start + task_counts[comm.rank]
+        shares.append(recvbuf[start:stop])
+        start = stop
+    return shares
+
+
+@_collective
+def gatherv(data, comm, root=0, counts=None, layout=None):
+    """Gathers a 1-d NumPy array from every rank into a single array on root with Gatherv.
+
+    Args:
+        data: this rank's array. all ranks must use the same dtype.
+        comm: an MPI communicator.
+        root: the rank that receives the result.
+        counts: the length of data on each rank. gathered first if not provided.
+        layout: the Partitioner, or its name, that the shares were scattered with. the
+            shares are put back in item order, which undoes scatter(). None keeps rank
+            order.
+
+    Returns:
+        result: the concatenated arrays in rank order on root, None on other ranks.
+    """
+    indices = None
+    if layout is not None:
+        partitioner = _partitioner(layout)
+        n = comm.allreduce(len(data))
+        counts, displs = partitioner.decompose(n, comm.size)
+        indices = partitioner.indices(n, comm.size)
+    if counts is None:
+        counts = comm.gather(len(data), root=root)
+    recvbuf = None
+    result = None
+    if comm.rank == root:
+        displs = [sum(counts[:rank]) for rank in range(comm.size)]
+        result = np.empty(sum(counts), dtype=data.dtype)
+        recvbuf = [result, (counts, displs)]
+    comm.Gatherv(np.ascontiguousarray(data), recvbuf, root=root)
+    if result is not None and indices is not None:
+        # unpack the shares into item order
+        packed, result = result, np.empty_like(result)
+        result[indices] = packed
+    return result
+
+
+class SharedArray(object):
+    @_collective
+    def __init__(self, data, comm, root=0):
+        """A SharedArray places a copy of a NumPy array from root in node-local shared memory.
+
+        Ranks on the same node share a single copy in an MPI shared-memory window and read it
+        in place, so memory use does not grow with the number of ranks per node. Only one
+        leader rank per node takes part in the broadcast between nodes.
+
+        Use it as a context manager or call free() once the ranks are done with array. All
+        ranks of comm must call free() together.
+
+        Args:
+            data: the array to share on root, or a TaskFailure or CacheHit that is raised as
+                TaskFailed or TaskCached on all ranks. ignored on other ranks.
+            comm: an MPI communicator.
+            root: the rank that holds data.
+        """
+        from mpi4py import MPI
+
+        header = None
+        if comm.rank == root:
+            # a failed or cached task sends its envelope instead
+            header = data if _is_envelope(data) else (data.dtype.str, data.shape)
+        header = comm.bcast(header, root=root)
+        _raise_envelope(header)
+        dtype, shape = header
+        dtype = np.dtype(dtype)
+
+        # the ranks of each node share one window allocated by the node leader
+        node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.rank)
+        is_leader = node_comm.rank == 0
+        nbytes = int(np.prod(shape)) * dtype.itemsize if is_leader else 0
+        self.win = MPI.Win.Allocate_shared(nbytes, dtype.itemsize, comm=node_comm)
+        buf, itemsize = self.win.Shared_query(0)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=buf)
+
+        # root fills the window of its node
+        self.win.Fence()
+        if comm.rank == root:
+            self.array[...] = data
+        self.win.Fence()
+
+        # node leaders copy the array from the leader of the root's node
+        on_root_node = node_comm.allreduce(comm.rank == root, op=MPI.LOR)
+        leader_comm = comm.Split(0 if is_leader else MPI.UNDEFINED, key=comm.rank)
+        if leader_comm != MPI.COMM_NULL:
+            source = leader_comm.allgather(on_root_node).index(True)
+            leader_comm.Bcast(self.array, root=source)
+            leader_comm.Free()
+        self.win.Fence()
+        node_comm.Free()
+        self.array.flags.writeable = False
+
+    def free(self):
+        """Frees the shared-memory window. array must not be used afterwards."""
+        self.array = None
+        self.win.Free()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.free()
+
+
+@_collective
+def reduce(value, comm, root=0, combine=None):
+    """Combines the values of all ranks into a single value on root.
+
+    With the default combine, scalars and numeric arrays are summed elementwise with a
+    buffer-based Reduce. Any other value, or a custom combine, is merged along a binomial
+    tree: in each of the ceil(log2(size)) rounds half of the remaining ranks send their
+    partial result to a partner, which combines it with its own. No rank ever holds more than
+    two values, unlike gathering every value on root.
+
+    Args:
+        value: this rank's value. all ranks must pass values of the same type.
+        comm: an MPI communicator.
+        root: the rank that receives the result.
+        combine: an associative callable combine(a, b) returning the merged value. values
+            are combined in rank order when root is 0. defaults to addition.
+
+    Returns:
+        result: the combined value on root, None on other ranks.
+    """
+    numeric = np.isscalar(value) or is_array(value)
+    if combine is None and numeric and np.asarray(value).dtype.kind in "biufc":
+        sendbuf = np.asarray(value, order="C")
+        recvbuf = np.empty_like(sendbuf) if comm.rank == root else None
+        comm.Reduce(sendbuf, recvbuf, root=root)
+        return None if recvbuf is None else recvbuf[()]
+
+    if combine is None:
+        combine = operator.add
+    # ranks relative to root so root is the last rank standing
+    rank = (comm.rank - root) % comm.size
+    mask = 1
+    while mask < comm.size:
+        if rank & mask:
+            # hand the partial result to the partner and drop out
+            comm.send(value, dest=(rank - mask + root) % comm.size, tag=6)
+            return None
+        if rank + mask < comm.size:
+            value = combine(value, comm.recv(source=(rank + mask + root) % comm.size, tag=6))
+        mask <<= 1
+    return value
+
+
+@_collective
+def agree_failures(failures, comm):
+    """Agrees on the failed tasks of a batch on all ranks of comm. Every rank passes the
+    TaskFailure it caught for each task, or None.
+
+    The ranks first count the failed ranks of each task with one Allreduce of a status array,
+    and only gather the failures of the tasks that failed somewhere.
+
+    Returns:
+        failures: the first TaskFailure of each task on any rank, or None, the same on all
+            ranks.
+    """
+    status = np.array([0 if failure is None else 1 for failure in failures], dtype="i")
+    nfailed = np.empty_like(status)
+    comm.Allreduce(status, nfailed)
+    failed = [task for task, n in enumerate(nfailed) if n != 0]
+    results = [None] * len(failures)
+    if not failed:
+        return results
+    gathered = comm.allgather([failures[task] for task in failed])
+    for i, task in enumerate(failed):
+        results[task] = next(rank_failures[i] for rank_failures in gathered if rank_failures[i])
+    return results
+
+
+def read_all(path, comm, n, dtype, offset=0, layout="strided"):
+    """Reads this rank's share of n items from a binary file with a collective MPI-IO read.
+
+    Every rank sets a file view that exposes only its own share, using the same partitioner
+    as scatter(), and all ranks read at once so the MPI-IO layer can aggregate the requests.
+    The items of a share arrive in file order.
+
+    Args:
+        path: the path of the file, visible to all ranks.
+        comm: an MPI communicator or None to read all n items.
+        n: the number of items to divide between ranks.
+        dtype: the NumPy dtype of the items in the file.
+        offset: the number of items in the file before the first item.
+        layout: a Partitioner or the name of one, as in scatter().
+
+    Returns:
+        result: this rank's share of the items.
+    """
+    dtype = np.dtype(dtype)
+    if comm is None:
+        return np.fromfile(path, dtype=dtype, count=n, offset=offset * dtype.itemsize)
+    from mpi4py import MPI
+
+    partitioner = _partitioner(layout)
+    counts, displs = partitioner.decompose(n, comm.size)
+    result = np.empty(counts[comm.rank], dtype=dtype)
+    fh = MPI.File.Open(comm, path, MPI.MODE_RDONLY)
+    try:
+        _set_view(fh, comm, dtype, offset, n, partitioner)
+        fh.Read_all(result)
+    finally:
+        fh.Close()
+    return result
+
+
+def write_all(path, data, comm, n, offset=0, layout="strided"):
+    """Writes this rank's share of n items to a binary file with a collective MPI-IO write.
+    The file is created if needed. The counterpart of read_all().
+
+    Args:
+        path: the path of the file, visible to all ranks.
+        data: this rank's share of the items, as returned by scatter() or read_all().
+        comm: an MPI communicator or None to write all n items.
+        n: the total number of items written by all ranks.
+        offset: the number of items in the file before the first item.
+        layout: a Partitioner or the name of one, as in scatter().
+    """
+    data = np.ascontiguousarray(data)
+    if comm is None:
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(offset * data.dtype.itemsize)
+            data.tofile(f)
+        return
+    from mpi4py import MPI
+
+    partitioner = _partitioner(layout)
+    counts, displs = partitioner.decompose(n, comm.size)
+    assert len(data) == counts[comm.rank], "data does not match the decomposition"
+    fh = MPI.File.Open(comm, path, MPI.MODE_WRONLY | MPI.MODE_CREATE)
+    try:
+        _set_view(fh, comm, data.dtype, offset, n, partitioner)
+        fh.Write_all(data)
+    finally:
+        fh.Close()
+
+
+def _set_view(fh, comm, dtype, offset, n, partitioner):
+    """Sets a file view that exposes only this rank's share of the n items of partitioner."""
+    from mpi4py.util.dtlib import from_numpy_dtype
+
+    etype = from_numpy_dtype(dtype)
+    counts, displs = partitioner.decompose(n, comm.size)
+    count, displ = counts[comm.rank], displs[comm.rank]
+    indices = partitioner.indices(n, comm.size)
+    if isinstance(partitioner, CyclicPartitioner):
+        # one block of every size blocks, starting at this rank's block
+        block = etype.Create_contiguous(partitioner.block)
+        filetype = block.Create_resized(0, comm.size * partitioner.block * dtype.itemsize)
+        filetype.Commit()
+        fh.Set_view((offset + comm.rank * partitioner.block) * dtype.itemsize, etype, filetype)
+        filetype.Free()
+        block.Free()
+    elif indices is None or count == 0:
+        # one block of consecutive items
+        fh.Set_view((offset + displ) * dtype.itemsize, etype, etype)
+    else:
+        # one block per run of consecutive items in this rank's share
+        items = np.sort(indices[displ : displ + count])
+        starts = np.flatnonzero(np.diff(items, prepend=items[0] - 2) != 1)
+        lengths = np.diff(np.append(starts, count))
+        filetype = etype.Create_indexed(lengths.tolist(), items[starts].tolist()).Commit()
+        fh.Set_view(offset * dtype.itemsize, etype, filetype)
+        filetype.Free()
 
 
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+
+class Partitioner(ABC):
+    """A Partitioner decides which items of a task each rank processes. It describes the
+    shares with the counts and displacements of Scatterv and Gatherv, over the items in
+    packed order: the share of rank 0 first, then the share of rank 1 and so on.
+
+    Subclasses implement decompose(). Those whose shares are not blocks of consecutive items
+    also implement indices(), the item order that packs the shares. The items each rank
+    gets differ between partitioners, but every item is processed by exactly one rank, so a
+    reduction gives the same result whichever partitioner is used.
+    """
+
+    @abstractmethod
+    def decompose(self, n, size):
+        """Returns the counts and displacements of the shares of n items between size ranks."""
+        raise NotImplementedError()
+
+    def indices(self, n, size):
+        """Returns the item indices in packed order, or None if packing keeps the item order,
+        in which case the shares are sent straight from the data without a copy.
+        """
+        return None
+
+    def share(self, data, rank, size):
+        """Returns the share of a sliceable data object that belongs to rank."""
+        counts, displs = self.decompose(len(data), size)
+        start, stop = displs[rank], displs[rank] + counts[rank]
+        indices = self.indices(len(data), size)
+        if indices is None:
+            return data[start:stop]
+        if is_array(data):
+            return data[indices[start:stop]]
+        return [data[i] for i in indices[start:stop]]
+
+
+class BlockPartitioner(Partitioner):
+    """Gives each rank one block of consecutive items, as even as possible."""
+
+    def decompose(self, n, size):
+        return decompose(n, size)
+
+
+class CyclicPartitioner(Partitioner):
+    def __init__(self, block=1):
+        """A CyclicPartitioner deals blocks of consecutive items to the ranks in turn: rank r
+        gets the blocks r, r + size, ... With block=1 this is the strided layout.
+
+        Args:
+            block: the number of consecutive items in a block.
+        """
+        assert block >= 1, "block must be positive"
+        self.block = block
+
+    def decompose(self, n, size):
+        counts = np.bincount(self._owners(n, size), minlength=size).tolist()
+        displs = [sum(counts[:rank]) for rank in range(size)]
+        return counts, displs
+
+    def indices(self, n, size):
+        return np.argsort(self._owners(n, size), kind="stable")
+
+    def share(self, data, rank, size):
+        if self.block == 1:
+            return data[rank::size]
+        return super().share(data, rank, size)
+
+    def _owners(self, n, size):
+        """Returns the rank that gets each item."""
+        return np.arange(n) // self.block % size
+
+
+class WeightedPartitioner(Partitioner):
+    def __init__(self, weights):
+        """A WeightedPartitioner gives each rank one block of consecutive items whose size is
+        proportional to the rank's weight. Weights are speeds or capacities, not costs: a rank
+        with twice the weight gets twice the items. To balance per-item costs, pass their
+        inverses.
+
+        Args:
+            weights: one nonnegative weight per rank, the same on all ranks.
+        """
+        assert sum(weights) > 0, "at least one weight must be positive"
+        self.weights = list(weights)
+
+    def decompose(self, n, size):
+        assert len(self.weights) == size, "there must be one weight per rank"
+        return decompose(n, size, self.weights)
+
+
+class CustomPartitioner(Partitioner):
+    def __init__(self, func):
+        """A CustomPartitioner gives each rank one block of consecutive items with the sizes
+        returned by a user function.
+
+        Args:
+            func: a callable that takes the number of items and ranks and returns the count
+                of each rank. it must return the same counts on all ranks.
+        """
+        self.func = func
+
+    def decompose(self, n, size):
+        counts = list(self.func(n, size))
+        assert len(counts) == size and sum(counts) == n, "counts must split n items"
+        displs = [sum(counts[:rank]) for rank in range(size)]
+        return counts, displs
+
+
+_PARTITIONERS = {"strided": CyclicPartitioner, "contiguous": BlockPartitioner}
+
+
+def _partitioner(layout):
+    """Returns the Partitioner for a layout name, or layout itself if it is one."""
+    if isinstance(layout, Partitioner):
+        return layout
+    assert layout in _PARTITIONERS, f"unknown layout {layout}"
+    return _PARTITIONERS[layout]()
+
+
+class StageTimer(object):
+    def __init__(self):
+        """A StageTimer records how long a rank spends in each stage of each task. Time spent inside
+        the read/process/write functions is recorded as "work" and time spent blocked in
+        communication as "wait". Pass a StageTimer to a coordinator to enable instrumentation.
+        Coordinators without one skip all timing.
+
+        The collective helpers called inside a work span (scatter, reduce, gatherv, SharedArray
+        and the straggler and stream broadcasts) split it, so the time a rank waits for a
+        straggler in a collective is recorded as wait rather than work.
+
+        Spans use time.time() so that timelines from ranks on the same node line up.
+        """
+        self.events = []
+
+    @contextmanager
+    def span(self, task, stage, kind):
+        if kind != "work":
+            start = time.time()
+            try:
+                yield
+            finally:
+                self.events.append((task, stage, kind, start, time.time()))
+            return
+        # a work span stays open for waiting() until it ends
+        span = [task, stage, time.time()]
+        token = _open_span.set((self, span))
+        try:
+            yield
+        finally:
+            _open_span.reset(token)
+            self.events.append((task, stage, kind, span[2], time.time()))
+
+    @contextmanager
+    def waiting(self, span):
+        """Records the time inside the open work span as wait, then resumes the work span."""
+        task, stage, start = span
+        if start is None:
+            # already waiting in an outer collective
+            yield
+            return
+        now = time.time()
+        self.events.append((task, stage, "work", start, now))
+        span[2] = None
+        try:
+            yield
+        finally:
+            span[2] = time.time()
+            self.events.append((task, stage, "wait", now, span[2]))
+
+    def gather(self, comm, root=0):
+        """Gathers the events of all ranks on root.
+
+        Args:
+            comm: an MPI communicator or None.
+            root: the rank that receives the events.
+
+        Returns:
+            events: a list of (rank, task, stage, kind, start, end) tuples on root, None on
+                other ranks.
+        """
+        if comm is None:
+            return [(0,) + event for event in self.events]
+        events = comm.gather(self.events, root=root)
+        if events is None:
+            return None
+        return [(rank,) + event for rank, rank_events in enumerate(events) for event in rank_events]
+
+
+def timing_summary(events):
+    """Returns a table with the total work and wait time of each rank in each stage."""
+    totals = {}
+    for rank, task, stage, kind, start, end in events:
+        row = totals.setdefault((rank, stage), {"tasks": set(), "work": 0.0, "wait": 0.0})
+        row["tasks"].add(task)
+        row[kind] += end - start
+    lines = [f"{'rank':>4} {'stage':>8} {'tasks':>5} {'work':>8} {'wait':>8} {'wait %':>6}"]
+    for (rank, stage), row in sorted(totals.items()):
+        total = row["work"] + row["wait"]
+        percent = 100 * row["wait"] / total if total > 0 else 0.0
+        lines.append(
+            f"{rank:>4} {stage:>8} {len(row['tasks']):>5} "
+            f"{row['work']:>8.3f} {row['wait']:>8.3f} {percent:>6.1f}"
+        )
+    return "\n".join(lines)
+
+
+def chrome_trace(events):
+    """Returns the events in the Chrome trace event format with one row per rank. Load the
+    JSON-encoded result in chrome://tracing or https://ui.perfetto.dev.
+    """
+    origin = min((start for *_, start, end in events), default=0.0)
+    return {
+        "traceEvents": [
+            {
+                "name": f"{stage} {kind}",
+                "cat": kind,
+                "ph": "X",
+                "ts": 1e6 * (start - origin),
+                "dur": 1e6 * (end - start),
+                "pid": 0,
+                "tid": rank,
+                "args": {"task": task},
+            }
+            for rank, task, stage, kind, start, end in events
+        ]
+    }
+
+
+class StragglerMonitor(object):
+    def __init__(self, window=5, threshold=1.5, patience=3, rebalance=False):
+        """A StragglerMonitor tracks how long each rank of a work_comm takes to process its
+        share of a task, over a sliding window of the last window tasks. Only the processing
+        itself is measured, since the time in the collectives around it is mostly spent
+        waiting for the slowest rank.
+
+        A rank is a straggler when it took more than threshold times the mean rank time in
+        at least patience tasks of the window. With rebalance, weights() returns the items
+        per second of each rank so the decomposition can give slow ranks less work, which
+        brings every rank close to the mean time.
+
+        Args:
+            window: the number of tasks to remember.
+            threshold: how much slower than the mean a rank must be to count as slow.
+            patience: in how many tasks of the window a rank must be slow to be flagged.
+            rebalance: weight the decomposition by the measured speed of each rank.
+        """
+        self.threshold = threshold
+        self.patience = patience
+        self.rebalance = rebalance
+        # a list of (seconds, items) per rank for each task in the window
+        self.samples = deque(maxlen=window)
+        self._sample = (0.0, 0)
+
+    @contextmanager
+    def measure(self, items):
+        """Records how long this rank takes to process items items. The measurements of one
+        task add up until update(), so a task processed in chunks counts as a whole.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds, total = self._sample
+            self._sample = (seconds + time.perf_counter() - start, total + items)
+
+    def update(self, comm):
+        """Shares this rank's last measurement with all ranks of comm, so every rank has the
+        same window and computes the same weights. Call once per task on all ranks.
+
+        Returns:
+            stragglers: the ranks that are currently flagged as stragglers.
+        """
+        with _waiting():
+            self.samples.append(comm.allgather(self._sample))
+        self._sample = (0.0, 0)
+        return self.stragglers()
+
+    def stragglers(self):
+        """Returns the ranks that were slow in at least patience tasks of the window."""
+        slow = {}
+        for sample in self.samples:
+            mean = sum(seconds for seconds, items in sample) / len(sample)
+            for rank, (seconds, items) in enumerate(sample):
+                if seconds > self.threshold * mean:
+                    slow[rank] = slow.get(rank, 0) + 1
+        return sorted(rank for rank, count in slow.items() if count >= self.patience)
+
+    def weights(self):
+        """Returns the items per second of each rank over the window, or None without
+        rebalance or measurements.
+        """
+        if not self.rebalance or not self.samples:
+            return None
+        rates = []
+        for rank in range(len(self.samples[0])):
+            seconds = sum(sample[rank][0] for sample in self.samples)
+            items = sum(sample[rank][1] for sample in self.samples)
+            rates.append(items / seconds if items > 0 and seconds > 0 else None)
+        measured = [rate for rate in rates if rate is not None]
+        if not measured:
+            return None
+        # ranks without work yet are assumed to be average
+        mean = sum(measured) / len(measured)
+        return [mean if rate is None else rate for rate in rates]
+
+
+class ResultCache(object):
+    def __init__(self, directory, max_bytes=2**30, params=None):
+        """A ResultCache keeps task results on disk so reruns can skip tasks that already
+        succeeded. Results are keyed by the task index, a hash of the task input and params,
+        so a task is recomputed when its input or the parameters change.
+
+        Each result is pickled to its own file in directory, which must be visible to the
+        ranks that look up and store results. When the files exceed max_bytes, the least
+        recently used results are evicted.
+
+        Args:
+            directory: the cache directory. created if needed.
+            max_bytes: the maximum total size of the cached results.
+            params: a picklable value with the parameters that affect the results.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.params = pickle.dumps(params)
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, index, data):
+        """Returns the key of the result of task index with input data."""
+        digest = hashlib.sha256(pickle.dumps(index) + self.params)
+        if is_array(data):
+            digest.update(pickle.dumps((data.dtype.str, data.shape)))
+            digest.update(np.ascontiguousarray(data).data)
+        else:
+            digest.update(pickle.dumps(data))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns (True, result) if the result of key is cached and (False, None) otherwise."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            # the modification time is the LRU clock
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        return True, result
+
+    def put(self, key, result):
+        """Stores the result of key, then evicts results until the cache fits in max_bytes."""
+        path = self._path(key)
+        # write to a temporary file first so a reader never sees a partial result
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(result, f)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+
+class TaskFailure(object):
+    def __init__(self, index, stage, rank, error):
+        """A TaskFailure is the error envelope of a task whose read or process step failed.
+        It is sent in place of the task's data, in the messages that would have carried the
+        data, so a failure flows down the read, process and write pipeline without extra
+        messages and costs no more latency than a result. The helpers that distribute data
+        (scatter, SharedArray and the stream's chunk flag) broadcast it in place of their
+        header and raise it as TaskFailed on every rank, and the writer raises it instead of
+        writing.
+
+        Exceptions do not always pickle, so only the error message and traceback travel.
+
+        Args:
+            index: the index of the failed task.
+            stage: the step that failed, "read" or "process" ("write" for background writes,
+                write_batch() and the AsyncioCoordinator, which report failed writes
+                separately from their task, "run" for a whole task of a task scheduler).
+            rank: the rank where the error was raised.
+            error: the exception.
+        """
+        self.index = index
+        self.stage = stage
+        self.rank = rank
+        self.error = f"{type(error).__name__}: {error}"
+        self.traceback = "".join(
+            traceback.format_exception(type(error), error, error.__traceback__)
+        )
+
+    def __str__(self):
+        return f"task {self.index} failed to {self.stage} on rank {self.rank}: {self.error}"
+
+
+class TaskFailed(RuntimeError):
+    """Raised for a task whose TaskFailure arrived in place of its data."""
+
+    def __init__(self, failure):
+        super().__init__(failure)
+        self.failure = failure
+
+
+class CacheHit(object):
+    def __init__(self, index):
+        """A CacheHit is sent to the workers in place of the input of a task whose result was
+        found in the cache. Like a TaskFailure, scatter and SharedArray broadcast it in place
+        of their header and raise it as TaskCached on every rank, so the workers skip the task
+        without an extra collective. Process functions must distribute their input with one of
+        them for cache hits to skip processing.
+
+        Args:
+            index: the index of the cached task.
+        """
+        self.index = index
+
+
+class TaskCached(Exception):
+    """Raised for a task whose CacheHit arrived in place of its data."""
+
+    def __init__(self, hit):
+        super().__init__(f"task {hit.index} is cached")
+        self.hit = hit
+
+
+def _is_envelope(data):
+    """Returns True if data is a TaskFailure or CacheHit sent in place of a task's data."""
+    return isinstance(data, (TaskFailure, CacheHit))
+
+
+def _raise_envelope(header):
+    """Raises the exception for an envelope received in place of a header, if it is one."""
+    if isinstance(header, TaskFailure):
+        raise TaskFailed(header)
+    if isinstance(header, CacheHit):
+        raise TaskCached(header)
+
+
+def _attempt(func, index, stage, rank):
+    """Returns func(index), or a TaskFailure if it raised."""
+    try:
+        return func(index)
+    except Exception as e:
+        return TaskFailure(index, stage, rank, e)
+
+
+class DeferredResult(object):
+    def __init__(self, func):
+        """A future-like object that calls func the first time its result is requested.
+
+        Args:
+            func: a callable with no arguments.
+        """
+        self._func = func
+        self._done = False
+        self._result = None
+
+    def result(self):
+        if not self._done:
+            self._result = self._func()
+            self._done = True
+        return self._result
 
 
 class AbstractIOCoordinator(ABC):
-    @classmethod
-    def is_reader(cls, rank):
-        return rank == cls._read_rank
+    _read_pool = None
+    _write_pool = None
+
+    def __init__(self, timer=None, cache=None):
+        """Initializes the state shared by all coordinators.
+
+        Args:
+            timer: a StageTimer to record per-task, per-stage timings, or None.
+            cache: a ResultCache to skip processing tasks with cached results, or None.
+        """
+        self.timer = timer
+        self.cache = cache
+        # count the calls to each step to know which task they belong to
+        self._indices = {"read": 0, "process": 0, "write": 0}
+        # the (key, hit, result) cache entry of each task between its read and write
+        self._entries = {}
+
+    def is_reader(self, rank=None):
+        """Returns True if rank (this rank by default) is one of the reader ranks."""
+        return (self.rank if rank is None else rank) in self.read_ranks
 
-    @classmethod
-    def is_writer(cls, rank):
-        return rank == cls._write_rank
+    def is_writer(self, rank=None):
+        """Returns True if rank (this rank by default) is one of the writer ranks."""
+        return (self.rank if rank is None else rank) in self.write_ranks
 
-    @classmethod
-    def is_worker_root(cls, rank):
-        return rank == cls._worker_root
+    def is_worker_root(self, rank=None):
+        """Returns True if rank (this rank by default) is the root of a worker group."""
+        return (self.rank if rank is None else rank) in self.worker_roots
 
-    @classmethod
-    def is_worker(cls, rank):
-        return rank >= cls._worker_root
+    def is_worker(self, rank=None):
+        """Returns True if rank (this rank by default) is one of the worker ranks."""
+        return (self.rank if rank is None else rank) in self.worker_ranks
 
     @abstractmethod
     def read(self, func, payload):
         """Read input via func()."""
         raise NotImplementedError()
 
+    @abstractmethod
+    def read_stream(self, func, payload, window=2):
+        """Streams input via func(), a generator of chunks. Streamed tasks are not cached,
+        since their key is only known once the whole input went to the workers.
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     def process(self, func, payload):
         """Returns the result of func()."""
@@ -92,18 +1220,192 @@ class AbstractIOCoordinator(ABC):
         """Writes output by calling func(payload)."""
         raise NotImplementedError()
 
+    def read_async(self, func, payload):
+        """Starts reading input via func() and returns immediately. With background IO, the read
+        runs on a background thread. Otherwise it is deferred until its result is requested, so
+        requesting the next task's input before processing the current task is always safe.
+
+        Args:
+            func: a callable with no arguments. must not call MPI with background IO.
+            payload: a dummy value matching the return signature of func.
+
+        Returns:
+            result: a future-like object whose result() returns the result of read(func, payload).
+        """
+        if self._read_pool is not None:
+            return self._read_pool.submit(self.read, func, payload)
+        return DeferredResult(lambda: self.read(func, payload))
+
+    def read_batch(self, indices, func, payload):
+        """Reads a batch of tasks with one read step, so the batch costs one message instead
+        of one per task. An error only fails its own task, whose TaskFailure takes the place
+        of its input.
+
+        Args:
+            indices: the indices of the tasks in the batch.
+            func: a callable that takes a task index and returns its input.
+            payload: a dummy value matching the return signature of read().
+
+        Returns:
+            result: like read(), with the list of inputs or TaskFailures of the batch.
+        """
+
+        def read_all():
+            return [_attempt(func, index, "read", self.rank) for index in indices]
+
+        return self.read(read_all, payload)
+
+    def write_batch(self, indices, func, payload):
+        """Writes a batch of tasks with one write step. func is called per task, and an error
+        only fails its own task.
+
+        Args:
+            indices: the indices of the tasks in the batch.
+            func: a callable that takes a task index and its result.
+            payload: on the worker root, the list of results or TaskFailures of the batch.
+                otherwise, a dummy value.
+
+        Returns:
+            failures: on the writer rank, the TaskFailure of every task in the batch that
+                failed to read, process or write. an empty list on other ranks.
+        """
+        failures = []
+
+        def write_all(results):
+            for index, result in zip(indices, results):
+                if not isinstance(result, TaskFailure):
+                    result = _attempt(lambda i: func(i, result), index, "write", self.rank)
+                if isinstance(result, TaskFailure):
+                    failures.append(result)
+
+        self.write(write_all, payload)
+        return failures
+
+    def close(self):
+        """Completes any outstanding communication. Call once after the last task. With
+        background IO, raises the first error of the writes that were not reported yet, so
+        call again until it returns to see all of them.
+        """
+        self._finish_writes()
+
+    def _next_index(self, stage):
+        """Returns the index of the task that the current call to stage belongs to."""
+        index = self._indices[stage]
+        self._indices[stage] += 1
+        return index
+
+    def _timed(self, index, stage, kind):
+        """Returns a context manager that records a span with the timer, if there is one."""
+        if self.timer is None:
+            return _UNTIMED
+        return self.timer.span(index, stage, kind)
+
+    def _timed_chunks(self, index, chunks):
+        """Yields from chunks, recording the time to produce each chunk as read work."""
+        chunks = iter(chunks)
+        while True:
+            with self._timed(index, "read", "work"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def _lookup(self, index, data):
+        """Looks up the result of task index with input data in the cache.
+
+        Returns:
+            entry: a (key, hit, result) tuple. result is None unless hit is True.
+        """
+        key = self.cache.key(index, data)
+        hit, result = self.cache.get(key)
+        return key, hit, result
+
+    def _store_key(self, index):
+        """Forgets the cache entry of task index. Returns the key to store its result under
+        once written, or None if the result is already cached or was never looked up.
+        """
+        key, hit, result = self._entries.pop(index, (None, False, None))
+        return None if hit else key
+
+    def _write_work(self, index, func, payload, key=None):
+        if isinstance(payload, TaskFailure):
+            # a failed task arrives in place of its result, there is nothing to write
+            raise TaskFailed(payload)
+        with self._timed(index, "write", "work"):
+            result = func(payload)
+            # cache the result only once it was written successfully
+            if key is not None:
+                self.cache.put(key, payload)
+        return result
+
+    def _start_background_io(self):
+        """Starts one background thread for reads and one for writes. A single thread per
+        direction keeps reads and writes in task order.
+        """
+        self._read_pool = ThreadPoolExecutor(max_workers=1)
+        self._write_pool = ThreadPoolExecutor(max_workers=1)
+        self._writes = []
+
+    def _write_async(self, index, func, payload, key=None):
+        """Submits func(payload) to the background writer, then raises the first error of an
+        earlier write that has finished. The current write is submitted either way.
+        """
+        future = self._write_pool.submit(self._background_write, index, func, payload, key)
+        self._writes.append(future)
+        self._finish_writes(wait=False)
+        return future
+
+    def _background_write(self, index, func, payload, key=None):
+        """Runs _write_work() on the background writer. A write error is raised as TaskFailed,
+        since it reaches the main thread in a later call than the write of its task.
+        """
+        try:
+            return self._write_work(index, func, payload, key)
+        except TaskFailed:
+            raise
+        except Exception as e:
+            raise TaskFailed(TaskFailure(index, "write", self.rank, e)) from e
+
+    def _finish_writes(self, wait=True):
+        """Collects finished background writes, raising the first error. With wait=True, waits for
+        all writes and stops the background threads first. The writes after a raised error stay
+        queued, so the next call reports their errors.
+        """
+        if self._write_pool is None:
+            return
+        if wait:
+            self._read_pool.shutdown()
+            self._write_pool.shutdown()
+        while self._writes and self._writes[0].done():
+            self._writes.pop(0).result()
+
+
+_UNTIMED = nullcontext()
+
 
 class NoMPIIOCoordinator(AbstractIOCoordinator):
-    _read_rank = 0
-    _write_rank = 0
-    _worker_root = 0
+    def __init__(self, background_io=False, timer=None, cache=None):
+        """A NoMPIIOCoordinator coordinates read/process/write steps of a program when run without MPI.
 
-    def __init__(self):
-        """A NoMPIIOCoordinator coordinates read/process/write steps of a program when run without MPI."""
+        With background_io, reads requested with read_async() and writes run on background threads
+        while the main thread processes, which overlaps IO and compute without extra ranks.
+
+        Args:
+            background_io: overlap reads and writes with processing using background threads.
+            timer: a StageTimer to record per-task, per-stage timings, or None.
+            cache: a ResultCache to skip processing tasks with cached results, or None.
+        """
+        super().__init__(timer, cache)
         self.comm = None
         self.rank = 0
         self.size = 1
         self.work_comm = None
+        self.read_ranks = [0]
+        self.write_ranks = [0]
+        self.worker_roots = [0]
+        self.worker_ranks = [0]
+        if background_io:
+            self._start_background_io()
 
     def read(self, func, payload):
         """Reads input via func().
@@ -115,7 +1417,27 @@ class NoMPIIOCoordinator(AbstractIOCoordinator):
         Returns:
             result: the result of func().
         """
-        return func()
+        index = self._next_index("read")
+        with self._timed(index, "read", "work"):
+            result = func()
+            if self.cache is not None:
+                self._entries[index] = self._lookup(index, result)
+        return result
+
+    def read_stream(self, func, payload, window=2):
+        """Streams input via func(), a generator of chunks. Chunks are produced lazily as the
+        returned iterator is consumed, so only one chunk is held at a time.
+
+        Args:
+            func: a callable with no arguments that returns an iterable of chunks.
+            payload: a dummy value matching the return signature of func.
+            window: unused without MPI.
+
+        Returns:
+            result: an iterator over the chunks.
+        """
+        index = self._next_index("read")
+        return self._timed_chunks(index, func())
 
     def process(self, func, payload):
         """Returns the result of func().
@@ -127,7 +1449,13 @@ class NoMPIIOCoordinator(AbstractIOCoordinator):
         Returns:
             result: the result of func().
         """
-        return func()
+        index = self._next_index("process")
+        key, hit, result = self._entries.get(index, (None, False, None))
+        if hit:
+            # the cached result stands in for func()
+            return result
+        with self._timed(index, "process", "work"):
+            return func()
 
     def write(self, func, payload):
         """Writes output by calling func(payload).
@@ -137,28 +1465,42 @@ class NoMPIIOCoordinator(AbstractIOCoordinator):
             payload: the argument to pass to func.
 
         Rertuns:
-            result: the result of func(payload).
+            result: the result of func(payload). with background IO, a future for it.
         """
-        return func(payload)
+        index = self._next_index("write")
+        key = self._store_key(index)
+        if self._write_pool is not None:
+            return self._write_async(index, func, payload, key)
+        return self._write_work(index, func, payload, key)
 
 
 class SerialIOCoordinator(AbstractIOCoordinator):
-    _read_rank = 0
-    _write_rank = 0
-    _worker_root = 0
-
-    def __init__(self, comm):
+    def __init__(self, comm, background_io=False, timer=None, cache=None):
         """A SerialIOCoordinator coordinates read/process/write steps of a program using MPI.
         The read and write steps will performed by the root rank of the provided MPI communicator.
         All ranks will peform the process step.
 
+        With background_io, the root rank runs reads requested with read_async() and writes on
+        background threads while it takes part in processing. The overlap is similar to a
+        ParallelIOCoordinator without dedicating ranks to IO.
+
         Args:
             comm: an MPI communicator.
+            background_io: overlap reads and writes with processing using background threads.
+            timer: a StageTimer to record per-task, per-stage timings, or None.
+            cache: a ResultCache to skip processing tasks with cached results, or None.
         """
+        super().__init__(timer, cache)
         self.comm = comm
         self.rank = comm.rank
         self.size = comm.size
         self.work_comm = comm
+        self.read_ranks = [0]
+        self.write_ranks = [0]
+        self.worker_roots = [0]
+        self.worker_ranks = range(self.size)
+        if background_io and self.is_writer():
+            self._start_background_io()
 
     def read(self, func, payload):
         """Reads input via func() on reader rank. Meanwhile, other ranks proceed and are not blocked.
@@ -171,12 +1513,37 @@ class SerialIOCoordinator(AbstractIOCoordinator):
             result: all ranks return dummy payload except the reader rank which returns
                 the result of func().
         """
-        if SerialIOCoordinator.is_reader(self.rank):
-            result = func()
+        index = self._next_index("read")
+        if self.is_reader():
+            with self._timed(index, "read", "work"):
+                result = func()
+                if self.cache is not None:
+                    self._entries[index] = self._lookup(index, result)
+                    if self._entries[index][1]:
+                        # the workers skip the task when they see the hit instead of the input
+                        result = CacheHit(index)
         else:
             result = payload
         return result
 
+    def read_stream(self, func, payload, window=2):
+        """Streams input via func(), a generator of chunks, on reader rank. The reader is also
+        the worker root, so chunks are produced lazily as the returned iterator is consumed.
+
+        Args:
+            func: a callable with no arguments that returns an iterable of chunks.
+            payload: a dummy value matching the return signature of func.
+            window: unused, chunks are not sent to another rank.
+
+        Returns:
+            result: all ranks return dummy payload except the reader rank which returns
+                an iterator over the chunks.
+        """
+        index = self._next_index("read")
+        if self.is_reader():
+            return self._timed_chunks(index, func())
+        return payload
+
     def process(self, func, payload):
         """Returns the result of func(). Non-worker ranks return the provided dummy payload.
 
@@ -187,8 +1554,14 @@ class SerialIOCoordinator(AbstractIOCoordinator):
         Returns:
             result: workers return the result of func(). Non-worker ranks return the provided dummy payload.
         """
-        if SerialIOCoordinator.is_worker(self.rank):
-            result = func()
+        index = self._next_index("process")
+        if self.is_worker():
+            with self._timed(index, "process", "work"):
+                try:
+                    result = func()
+                except TaskCached:
+                    # the cached result stands in for func() on the reader
+                    result = self._entries[index][2] if self.is_reader() else payload
         else:
             result = payload
         return result
@@ -204,42 +1577,164 @@ class SerialIOCoordinator(AbstractIOCoordinator):
 
         Rertuns:
             result: all ranks return dummy payload except the writer rank, which returns
-                the result of func(payload).
+                the result of func(payload). with background IO, a future for it.
         """
-        if SerialIOCoordinator.is_writer(self.rank):
-            result = func(payload)
+        index = self._next_index("write")
+        key = self._store_key(index)
+        if self.is_writer() and self._write_pool is not None:
+            result = self._write_async(index, func, payload, key)
+        elif self.is_writer():
+            result = self._write_work(index, func, payload, key)
         else:
             result = payload
         return result
 
 
-class ParallelIOCoordinator(AbstractIOCoordinator):
-    _read_rank = 0
-    _write_rank = 1
-    _worker_root = 2
+class CollectiveIOCoordinator(SerialIOCoordinator):
+    def __init__(self, comm, timer=None, cache=None):
+        """A CollectiveIOCoordinator coordinates read/process/write steps of a program using MPI-IO.
+        All ranks perform all steps: every rank reads its own share of the input and writes its
+        own share of the output, typically with the collective read_all() and write_all(), so no
+        single rank funnels the IO of the whole program.
+
+        With a cache, each rank looks up its own share and a task is only skipped if every rank
+        has its share cached. Agreeing on that costs an allgather per task.
+
+        Args:
+            comm: an MPI communicator.
+            timer: a StageTimer to record per-task, per-stage timings, or None.
+            cache: a ResultCache to skip processing tasks with cached results, or None.
+        """
+        super().__init__(comm, timer=timer, cache=cache)
+        self.read_ranks = range(self.size)
+        self.write_ranks = range(self.size)
+
+    def read(self, func, payload):
+        """Reads this rank's input via func(). Every rank is a reader.
+
+        Args:
+            func: a callable with no arguments.
+            payload: unused, every rank reads.
+
+        Returns:
+            result: the result of func().
+        """
+        index = self._next_index("read")
+        with self._timed(index, "read", "work"):
+            result = func()
+            if self.cache is not None:
+                self._entries[index] = self._lookup(index, result)
+        return result
+
+    def process(self, func, payload):
+        """Returns the result of func(), or this rank's cached result if all ranks have one.
+
+        Args:
+            func: a callable with no arguments.
+            payload: unused, every rank processes.
+
+        Returns:
+            result: the result of func().
+        """
+        index = self._next_index("process")
+        if self.cache is not None:
+            key, hit, result = self._entries[index]
+            with self._timed(index, "process", "wait"):
+                hit = all(self.comm.allgather(hit))
+            if hit:
+                return result
+        with self._timed(index, "process", "work"):
+            return func()
 
-    def __init__(self, comm):
+
+class ParallelIOCoordinator(AbstractIOCoordinator):
+    def __init__(
+        self, comm, prefetch=0, ngroups=1, nreaders=1, nwriters=1, timer=None, cache=None
+    ):
         """
         A ParallelIOCoordinator coordinates read/process/write steps of a program using MPI.
         The read and write steps are performed on dedicated ranks which allows for parallel compute and IO
         when processing multiple tasks in series. The read and write steps between tasks will be interleaved
         with processing.
 
+        With prefetch > 0, the coordinator is pipelined: the reader streams up to prefetch tasks ahead
+        of the workers and the worker root streams up to prefetch results ahead of the writer using
+        nonblocking sends. MPI preserves message order between a pair of ranks so results arrive in task
+        order. Call close() after the last task to complete any sends still in flight.
+
+        With ngroups > 1, the worker ranks are split into ngroups groups of consecutive ranks that
+        process different tasks concurrently. Tasks are assigned to groups round-robin and every group
+        is fed by the same reader and writer ranks. Each group has its own work_comm and root.
+
+        With a cache, the reader looks up each task. On a hit, it sends the cached result straight
+        to the writer and a CacheHit to the worker root in place of the input, so the workers
+        skip the task without an extra collective (see CacheHit) and send nothing to the writer.
+
+        With nreaders > 1 or nwriters > 1, the first nreaders ranks read and the next nwriters ranks
+        write. Tasks are assigned to readers and writers round-robin so the IO bandwidth scales with
+        the number of IO ranks.
+
+        If reading a task fails, the reader sends a TaskFailure in place of the input. It reaches
+        the workers with the data (see TaskFailure) and the worker root sends it on in place of the
+        result, so the writer raises TaskFailed for that task while every other rank moves on.
+
         Args:
             comm: an MPI communicator.
+            prefetch: the maximum number of in-flight sends per rank. 0 disables pipelining.
+            ngroups: the number of worker groups.
+            nreaders: the number of reader ranks.
+            nwriters: the number of writer ranks.
+            timer: a StageTimer to record per-task, per-stage timings, or None.
+            cache: a ResultCache to skip processing tasks with cached results, or None.
         """
+        super().__init__(timer, cache)
         self.comm = comm
         self.rank = comm.rank
         self.size = comm.size
-        assert self.size >= 3, "ParallelIOCoordinator requires at least 3 MPI ranks"
-
-        # Initialize work comm
+        assert nreaders >= 1 and nwriters >= 1, "at least 1 reader and 1 writer are required"
+        nworkers = self.size - nreaders - nwriters
+        assert nworkers >= 1, "ParallelIOCoordinator requires at least 1 worker rank"
+        assert prefetch >= 0, "prefetch must be non-negative"
+        assert 1 <= ngroups <= nworkers, "ngroups must be between 1 and the number of workers"
+        self.read_ranks = range(nreaders)
+        self.write_ranks = range(nreaders, nreaders + nwriters)
+        self.worker_ranks = range(nreaders + nwriters, self.size)
+        self.prefetch = prefetch
+        self.ngroups = ngroups
+        self._requests = []
+
+        # Assign consecutive worker ranks to groups, the first rank of a group is its root
+        workers = self.worker_ranks
+        groups = [(rank - workers.start) * ngroups // nworkers for rank in workers]
+        self.worker_roots = [workers[groups.index(group)] for group in range(ngroups)]
+        self.group = None
+        if self.is_worker():
+            self.group = groups[self.rank - workers.start]
+
+        # Initialize work comm, the io ranks share a color that is not used for work
+        color = ngroups if self.group is None else self.group
+        work_comm = comm.Split(color, key=self.rank)
         self.work_comm = None
-        work_group = self.comm.group.Excl(
-            [ParallelIOCoordinator._read_rank, ParallelIOCoordinator._write_rank]
-        )
-        if ParallelIOCoordinator.is_worker(self.rank):
-            self.work_comm = comm.Create_group(work_group)
+        if self.group is None:
+            work_comm.Free()
+        else:
+            self.work_comm = work_comm
+
+    def _task_root(self, index):
+        """Returns the root rank of the group that processes task index."""
+        return self.worker_roots[index % self.ngroups]
+
+    def _task_reader(self, index):
+        """Returns the reader rank that reads task index."""
+        return self.read_ranks[index % len(self.read_ranks)]
+
+    def _task_writer(self, index):
+        """Returns the writer rank that writes task index."""
+        return self.write_ranks[index % len(self.write_ranks)]
+
+    def _is_task_worker(self, index):
+        """Returns True if this rank is in the group that processes task index."""
+        return self.group is not None and self.group == index % self.ngroups
 
     def read(self, func, payload):
         """Reads input via func() on reader rank and sends the result to worker root. Meanwhile,
@@ -253,35 +1748,125 @@ class ParallelIOCoordinator(AbstractIOCoordinator):
             result: all ranks return dummy payload except the worker root which returns
                 the result of func().
         """
-        if ParallelIOCoordinator.is_reader(self.rank):
+        index = self._next_index("read")
+        worker_root = self._task_root(index)
+        reader = self._task_reader(index)
+        if self.rank == reader:
             # read input via func()
-            result = func()
+            key, hit, cached = None, False, None
+            with self._timed(index, "read", "work"):
+                try:
+                    result = func()
+                except Exception as e:
+                    # the failure is sent in place of the input
+                    result = TaskFailure(index, "read", self.rank, e)
+                if self.cache is not None and not isinstance(result, TaskFailure):
+                    key, hit, cached = self._lookup(index, result)
             # send the result to worker root
-            self.comm.send(result, dest=ParallelIOCoordinator._worker_root, tag=1)
+            with self._timed(index, "read", "wait"):
+                # on a hit, the workers only get a CacheHit to skip the task
+                self._post(CacheHit(index) if hit else result, dest=worker_root, tag=1)
+                if self.cache is not None:
+                    # the writer gets the key, and the cached result on a hit, from the reader
+                    writer = self._task_writer(index)
+                    self._post((key, hit), dest=writer, tag=4)
+                    if hit:
+                        self._post(cached, dest=writer, tag=4)
             # dummy payload passes through
             result = payload
-        elif ParallelIOCoordinator.is_worker_root(self.rank):
+        elif self.rank == worker_root:
             # receive the result from reader
-            result = self.comm.recv(source=ParallelIOCoordinator._read_rank, tag=1)
+            with self._timed(index, "read", "wait"):
+                result = recv(self.comm, source=reader, tag=1)
+            if isinstance(result, CacheHit):
+                self._entries[index] = (None, True, None)
         else:
             # dummy payload passes through
             result = payload
         return result
 
+    def read_stream(self, func, payload, window=2):
+        """Streams input via func(), a generator of chunks, from reader rank to worker root.
+        Each chunk is sent as soon as it is produced and the worker root receives chunks as it
+        consumes them, so no rank holds a whole task's input. The reader uses synchronous sends
+        and blocks while window chunks are sent but not yet received, which bounds the memory
+        of a stream to window chunks in flight.
+
+        Args:
+            func: a callable with no arguments that returns an iterable of chunks. chunks must
+                not be None.
+            payload: a dummy value matching the return signature of func.
+            window: the maximum number of chunks in flight.
+
+        Returns:
+            result: all ranks return dummy payload except the worker root which returns
+                an iterator over the chunks.
+        """
+        index = self._next_index("read")
+        worker_root = self._task_root(index)
+        reader = self._task_reader(index)
+        if self.rank == reader:
+            end = None
+            try:
+                for chunk in self._timed_chunks(index, func()):
+                    # send the chunk to worker root
+                    with self._timed(index, "read", "wait"):
+                        self._issend(chunk, worker_root, 1, window)
+            except Exception as e:
+                # the failure ends the stream in place of the end marker
+                end = TaskFailure(index, "read", self.rank, e)
+            # mark the end of the stream
+            with self._timed(index, "read", "wait"):
+                self._issend(end, worker_root, 1, window)
+                if self.cache is not None:
+                    # streamed tasks are not cached, but the writer still waits for a key
+                    self._post((None, False), dest=self._task_writer(index), tag=4)
+            # dummy payload passes through
+            return payload
+        if self.rank == worker_root:
+            return self._recv_chunks(index, reader)
+        # dummy payload passes through
+        return payload
+
+    def _recv_chunks(self, index, reader):
+        """Yields the chunks of task index from reader until the end of the stream. If the
+        read failed, the TaskFailure is the last chunk.
+        """
+        while True:
+            with self._timed(index, "read", "wait"):
+                chunk = recv(self.comm, source=reader, tag=1)
+            if chunk is None:
+                return
+            yield chunk
+            if isinstance(chunk, TaskFailure):
+                return
+
     def process(self, func, payload):
-        """Returns the result of func(). Non-worker ranks return the provided dummy payload.
+        """Returns the result of func(). Ranks outside the worker group of this task return the
+        provided dummy payload.
 
         Args:
             func: a callable with no arguments.
             payload: a dummy value matching the return signature of func.
 
         Returns:
-            result: workers return the result of func(). Non-worker ranks return the provided dummy payload.
+            result: workers return the result of func(), or a TaskFailure if func() raised.
+                Non-worker ranks return the provided dummy payload.
         """
-        if ParallelIOCoordinator.is_worker(self.rank):
-            result = func()
-        else:
-            result = payload
+        index = self._next_index("process")
+        if not self._is_task_worker(index):
+            return payload
+        with self._timed(index, "process", "work"):
+            try:
+                result = func()
+            except TaskCached:
+                # the writer already has the cached result
+                result = payload
+            except TaskFailed as e:
+                # a read failure reached the workers in place of the input
+                result = e.failure
+            except Exception as e:
+                result = TaskFailure(index, "process", self.rank, e)
         return result
 
     def write(self, func, payload):
@@ -298,23 +1883,481 @@ class ParallelIOCoordinator(AbstractIOCoordinator):
             result: all ranks return dummy payload except the write_rank which returns
                 the result of func(payload).
         """
-        if ParallelIOCoordinator.is_worker_root(self.rank):
-            # receive the dummy from writer
-            result = self.comm.recv(source=ParallelIOCoordinator._write_rank, tag=2)
+        index = self._next_index("write")
+        worker_root = self._task_root(index)
+        writer = self._task_writer(index)
+        key = None
+        if self.cache is not None and self.rank == worker_root:
+            if self._entries.pop(index, (None, False, None))[1]:
+                # the reader sent the cached result to the writer
+                return payload
+        elif self.cache is not None and self.rank == writer:
+            reader = self._task_reader(index)
+            with self._timed(index, "write", "wait"):
+                key, hit = recv(self.comm, source=reader, tag=4)
+                if hit:
+                    payload = recv(self.comm, source=reader, tag=4)
+            if hit:
+                # the result is cached already, write it without the workers
+                return self._write_work(index, func, payload)
+        if self.prefetch > 0:
+            return self._pipelined_write(index, func, payload, worker_root, writer, key)
+        if self.rank == worker_root:
+            with self._timed(index, "write", "wait"):
+                # receive the dummy from writer
+                result = self.comm.recv(source=writer, tag=2)
+                # send the actual payload to writer
+                self._post(payload, dest=writer, tag=3)
+        elif self.rank == writer:
+            with self._timed(index, "write", "wait"):
+                # send the dummy payload to worker root
+                self.comm.send(payload, dest=worker_root, tag=2)
+                # receive actual payload from worker root
+                payload = recv(self.comm, source=worker_root, tag=3)
+            # call func with payload
+            result = self._write_work(index, func, payload, key)
+        else:
+            # dummy payload passes through
+            result = payload
+        return result
+
+    def _pipelined_write(self, index, func, payload, worker_root, writer, key=None):
+        """Writes output without the writer handshake. The worker root sends payload and proceeds
+        unless prefetch sends are already in flight. The writer drains results in task order.
+        """
+        if self.rank == worker_root:
             # send the actual payload to writer
-            self.comm.send(payload, dest=ParallelIOCoordinator._write_rank, tag=3)
-        elif ParallelIOCoordinator.is_writer(self.rank):
-            # send the dummy payload to worker root
-            self.comm.send(payload, dest=ParallelIOCoordinator._worker_root, tag=2)
+            with self._timed(index, "write", "wait"):
+                self._post(payload, dest=writer, tag=3)
+            result = payload
+        elif self.rank == writer:
             # receive actual payload from worker root
-            payload = self.comm.recv(source=ParallelIOCoordinator._worker_root, tag=3)
+            with self._timed(index, "write", "wait"):
+                payload = recv(self.comm, source=worker_root, tag=3)
             # call func with payload
-            result = func(payload)
+            result = self._write_work(index, func, payload, key)
         else:
             # dummy payload passes through
             result = payload
         return result
 
+    def _post(self, obj, dest, tag):
+        """Sends obj, without blocking when pipelined."""
+        if self.prefetch > 0:
+            self._isend(obj, dest=dest, tag=tag)
+        else:
+            send(obj, self.comm, dest=dest, tag=tag)
+
+    def _isend(self, obj, dest, tag):
+        """Starts a nonblocking send of obj. Waits for the oldest send if the window is full."""
+        self._requests.append(isend(obj, self.comm, dest=dest, tag=tag))
+        if len(self._requests) > self.prefetch:
+            for request in self._requests.pop(0):
+                request.Wait()
+
+    def _issend(self, obj, dest, tag, window):
+        """Starts a synchronous nonblocking send of obj. Waits while window sends are in flight."""
+        self._requests.append(isend(obj, self.comm, dest=dest, tag=tag, synchronous=True))
+        while len(self._requests) > window:
+            for request in self._requests.pop(0):
+                request.Wait()
+
+    def close(self):
+        """Waits for all in-flight sends to complete."""
+        with self._timed(None, "close", "wait"):
+            while self._requests:
+                for request in self._requests.pop(0):
+                    request.Wait()
+
+
+async def _run_stage(func, *args):
+    """Returns the result of func(*args). A coroutine function is awaited, any other callable
+    runs on the event loop's default thread pool so the loop keeps serving other tasks.
+    """
+    if inspect.iscoroutinefunction(func):
+        return await func(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+
+async def _read_stage(read, index, rank):
+    """Returns the input of task index from read(index), or a TaskFailure if it raised."""
+    try:
+        return await _run_stage(read, index)
+    except Exception as e:
+        return TaskFailure(index, "read", rank, e)
+
+
+async def _process_stage(process, index, data, rank):
+    """Returns the result of process(index, data), or a TaskFailure if it raised. process runs
+    on the event loop thread since it may call collectives on the work communicator.
+    """
+    try:
+        result = process(index, data)
+        if inspect.isawaitable(result):
+            result = await result
+    except TaskFailed as e:
+        # a read failure reached the workers in place of the input
+        result = e.failure
+    except Exception as e:
+        result = TaskFailure(index, "process", rank, e)
+    return result
+
+
+async def _write_stage(write, index, result, rank):
+    """Calls write(index, result). Returns the TaskFailure of the task, or None if it was written."""
+    if isinstance(result, TaskFailure):
+        # a failed task arrives in place of its result, there is nothing to write
+        return result
+    try:
+        await _run_stage(write, index, result)
+    except Exception as e:
+        return TaskFailure(index, "write", rank, e)
+    return None
+
+
+class NoMPIAsyncioCoordinator(object):
+    def __init__(self, window=2):
+        """A NoMPIAsyncioCoordinator runs the stages of AsyncioCoordinator.run() on a single
+        process. Up to window reads run ahead of processing and writes finish in the background,
+        so the IO of several tasks overlaps with processing.
+
+        Args:
+            window: the maximum number of tasks read ahead of processing.
+        """
+        assert window >= 1, "window must be at least 1"
+        self.comm = None
+        self.rank = 0
+        self.size = 1
+        self.work_comm = None
+        self.window = window
+
+    async def run(self, ntasks, read, process, write):
+        """Reads, processes and writes ntasks tasks. See AsyncioCoordinator.run().
+
+        Returns:
+            failures: the TaskFailure of every task that failed, ordered by task index.
+        """
+        reads = {}
+        writes = []
+        for index in range(ntasks):
+            # keep up to window reads in flight
+            for ahead in range(index, min(index + self.window, ntasks)):
+                if ahead not in reads:
+                    reads[ahead] = asyncio.ensure_future(_read_stage(read, ahead, self.rank))
+            data = await reads.pop(index)
+            result = data
+            if not isinstance(data, TaskFailure):
+                result = await _process_stage(process, index, data, self.rank)
+            writes.append(asyncio.ensure_future(_write_stage(write, index, result, self.rank)))
+        failures = await asyncio.gather(*writes)
+        return [failure for failure in failures if failure is not None]
+
+
+class AsyncioCoordinator(object):
+    _tag_base = 10
+
+    def __init__(self, comm, nreaders=1, nwriters=1, window=2, poll_interval=0.001):
+        """
+        An AsyncioCoordinator coordinates read/process/write steps of a program with asyncio.
+        Like the ParallelIOCoordinator, the first nreaders ranks read, the next nwriters ranks
+        write and the remaining ranks process the tasks together. Instead of every rank calling
+        every step with a dummy payload, each rank runs only the stages of its role as
+        coroutines, see run().
+
+        Communication uses nonblocking MPI requests that are polled by the event loop: while a
+        send or receive is pending the coroutine sleeps for poll_interval seconds and the loop
+        serves the other tasks. Each task is sent with its own tag so the messages of the tasks
+        in flight never mix, which lets a reader or writer rank serve many tasks at once.
+
+        Args:
+            comm: an MPI communicator.
+            nreaders: the number of reader ranks.
+            nwriters: the number of writer ranks.
+            window: the maximum number of tasks each reader reads ahead of the workers.
+            poll_interval: the seconds to sleep between tests of a pending request.
+        """
+        from mpi4py import MPI
+
+        self.comm = comm
+        self.rank = comm.rank
+        self.size = comm.size
+        assert nreaders >= 1 and nwriters >= 1, "at least 1 reader and 1 writer are required"
+        assert self.size - nreaders - nwriters >= 1, "AsyncioCoordinator requires a worker rank"
+        assert window >= 1, "window must be at least 1"
+        self.read_ranks = range(nreaders)
+        self.write_ranks = range(nreaders, nreaders + nwriters)
+        self.worker_ranks = range(nreaders + nwriters, self.size)
+        self.worker_root = self.worker_ranks[0]
+        self.window = window
+        self.poll_interval = poll_interval
+        self._tag_ub = comm.Get_attr(MPI.TAG_UB)
+
+        # Initialize work comm, the io ranks share a color that is not used for work
+        is_worker = self.rank in self.worker_ranks
+        work_comm = comm.Split(0 if is_worker else 1, key=self.rank)
+        self.work_comm = None
+        if is_worker:
+            self.work_comm = work_comm
+        else:
+            work_comm.Free()
+
+    def _task_reader(self, index):
+        """Returns the reader rank that reads task index."""
+        return self.read_ranks[index % len(self.read_ranks)]
+
+    def _task_writer(self, index):
+        """Returns the writer rank that writes task index."""
+        return self.write_ranks[index % len(self.write_ranks)]
+
+    def _tag(self, index):
+        """Returns the tag of the messages of task index."""
+        return self._tag_base + index % (self._tag_ub - self._tag_base)
+
+    async def wait(self, requests):
+        """Waits until all requests are complete, letting other coroutines run meanwhile."""
+        from mpi4py import MPI
+
+        while not MPI.Request.Testall(requests):
+            await asyncio.sleep(self.poll_interval)
+
+    async def send(self, obj, dest, tag, synchronous=False):
+        """Sends obj like send(), without blocking the event loop. With synchronous=True, the
+        send only completes once dest has started to receive it.
+        """
+        await self.wait(isend(obj, self.comm, dest=dest, tag=tag, synchronous=synchronous))
+
+    async def recv(self, source, tag):
+        """Receives an object sent with send() or isend(), without blocking the event loop."""
+        # a matched probe claims the header, so concurrent receives never steal it
+        while True:
+            message = self.comm.improbe(source=source, tag=tag)
+            if message is not None:
+                break
+            await asyncio.sleep(self.poll_interval)
+        spec, obj = message.recv()
+        if spec is not None:
+            dtype, shape = spec
+            obj = np.empty(shape, dtype=dtype)
+            await self.wait([self.comm.Irecv(obj, source=source, tag=tag)])
+        return obj
+
+    async def run(self, ntasks, read, process, write):
+        """Reads, processes and writes ntasks tasks. Every rank calls run() with the same
+        arguments, e.g. asyncio.run(coordinator.run(ntasks, read, process, write)).
+
+        Readers call read(index) for their tasks, up to window at a time, and send each input to
+        the worker root. Workers call process(index, data) for every task in order, since they
+        share the collectives of the work communicator. data is the input on the worker root
+        and None elsewhere. The worker root sends each result on without waiting for the writer,
+        which calls write(index, result) as soon as it arrives, for any number of tasks at once.
+
+        read and write may be coroutine functions. Plain functions run on a thread pool, so they
+        must not call MPI. process runs synchronously on the event loop thread and may call MPI
+        on work_comm. Its collectives are blocking calls, not awaitables: while a worker waits
+        in one, its event loop serves nothing else.
+
+        If read or process fails, the TaskFailure travels in place of the data (see TaskFailure)
+        and the task is not written. A process function that calls collectives must raise the
+        same error on every worker, as Task.divide_and_conquer() does by agreeing on failures
+        before its reduce. A worker that raises alone leaves the others waiting in the next
+        collective.
+
+        Args:
+            ntasks: the number of tasks.
+            read: a callable that takes a task index and returns its input.
+            process: a callable that takes a task index and its input and returns its result.
+            write: a callable that takes a task index and its result.
+
+        Returns:
+            failures: on writer ranks, the TaskFailure of every failed task they were to write,
+                ordered by task index. Other ranks return an empty list.
+        """
+        if self.rank in self.read_ranks:
+            window = asyncio.Semaphore(self.window)
+            indices = [i for i in range(ntasks) if self._task_reader(i) == self.rank]
+            await asyncio.gather(*(self._read_task(index, read, window) for index in indices))
+            return []
+        if self.rank in self.write_ranks:
+            indices = [i for i in range(ntasks) if self._task_writer(i) == self.rank]
+            failures = await asyncio.gather(*(self._write_task(index, write) for index in indices))
+            return [failure for failure in failures if failure is not None]
+        sends = []
+        for index in range(ntasks):
+            data = None
+            if self.rank == self.worker_root:
+                data = await self.recv(self._task_reader(index), self._tag(index))
+            result = await _process_stage(process, index, data, self.rank)
+            if self.rank == self.worker_root:
+                send = self.send(result, self._task_writer(index), self._tag(index))
+                sends.append(asyncio.ensure_future(send))
+        await asyncio.gather(*sends)
+        return []
+
+    async def _read_task(self, index, read, window):
+        """Reads task index and sends its input to the worker root. The synchronous send holds
+        the window slot until the worker root takes the input.
+        """
+        async with window:
+            data = await _read_stage(read, index, self.rank)
+            await self.send(data, self.worker_root, self._tag(index), synchronous=True)
+
+    async def _write_task(self, index, write):
+        """Receives the result of task index from the worker root and writes it."""
+        result = await self.recv(self.worker_root, self._tag(index))
+        return await _write_stage(write, index, result, self.rank)
+
+
+def _run_task(func, index, work_comm, rank):
+    """Returns func(index, work_comm), or the TaskFailure of the task if it raised. Within a
+    group, func must fail on every rank alike, e.g. by raising the TaskFailed of a scattered
+    TaskFailure, so the whole group skips the task.
+    """
+    try:
+        return func(index, work_comm)
+    except TaskFailed as e:
+        return e.failure
+    except Exception as e:
+        return TaskFailure(index, "run", rank, e)
+
+
+class NoMPITaskScheduler(object):
+    def __init__(self):
+        """A NoMPITaskScheduler runs every task in order when run without MPI."""
+        self.comm = None
+        self.rank = 0
+        self.size = 1
+        self.work_comm = None
+
+    def run(self, func, ntasks):
+        """Calls func(index, work_comm) for each task index. A task that raises is reported and
+        skipped.
+
+        Args:
+            func: a callable that takes a task index and a work communicator (None here).
+            ntasks: the number of tasks.
+
+        Returns:
+            results: the results of func ordered by task index, or the TaskFailure of each task
+                that failed.
+        """
+        results = []
+        for index in range(ntasks):
+            result = _run_task(func, index, self.work_comm, self.rank)
+            if isinstance(result, TaskFailure):
+                print(f"{self.rank}: ({index}) skipping -> {result}")
+            results.append(result)
+        return results
+
+
+class DynamicTaskScheduler(object):
+    _dispatch_rank = 0
+
+    def __init__(self, comm, group_size=1, schedule="guided", chunk_size=1):
+        """A DynamicTaskScheduler hands out tasks to idle workers on request instead of processing
+        every task in lockstep. The dispatch rank only hands out tasks. All other ranks are split
+        into worker groups of group_size ranks. The root of each group requests a chunk of task
+        indices from the dispatcher whenever its group is idle so fast groups simply process more
+        tasks and the wall time on skewed workloads approaches total work / number of groups.
+
+        With the "static" schedule every chunk has chunk_size tasks. With the "guided" schedule
+        chunks start large and shrink as the remaining work shrinks, but never below chunk_size.
+
+        Args:
+            comm: an MPI communicator.
+            group_size: the number of ranks that work on each task together.
+            schedule: "guided" or "static".
+            chunk_size: the (minimum) number of tasks handed out per request.
+        """
+        self.comm = comm
+        self.rank = comm.rank
+        self.size = comm.size
+        assert self.size >= 2, "DynamicTaskScheduler requires at least 2 MPI ranks"
+        assert schedule in ("guided", "static"), f"unknown schedule {schedule}"
+        self.group_size = group_size
+        self.schedule = schedule
+        self.chunk_size = chunk_size
+        self.ngroups = -(-(self.size - 1) // group_size)
+
+        # Initialize work comm, the dispatcher gets a group of its own
+        if self.is_dispatcher():
+            color = 0
+        else:
+            color = 1 + (self.rank - 1) // group_size
+        group_comm = comm.Split(color, key=self.rank)
+        self.work_comm = None
+        if self.is_dispatcher() or group_size == 1:
+            group_comm.Free()
+        else:
+            self.work_comm = group_comm
+
+    def is_dispatcher(self):
+        return self.rank == DynamicTaskScheduler._dispatch_rank
+
+    def is_group_root(self):
+        return not self.is_dispatcher() and (self.rank - 1) % self.group_size == 0
+
+    def run(self, func, ntasks):
+        """Calls func(index, work_comm) once for each task index on whichever worker group is idle.
+        All ranks in a group call func together with the group's work_comm (None for single-rank
+        groups). A task that raises is reported by the group root and skipped, and the group
+        keeps requesting tasks. func must raise on every rank of the group alike, see
+        _run_task().
+
+        Args:
+            func: a callable that takes a task index and a work communicator.
+            ntasks: the number of tasks.
+
+        Returns:
+            results: the dispatcher returns the results of func from each group root ordered by
+                task index, or the TaskFailure of each task that failed. workers return None.
+        """
+        if self.is_dispatcher():
+            return self._dispatch(ntasks)
+        return self._work(func)
+
+    def _next_chunk(self, start, ntasks):
+        size = self.chunk_size
+        if self.schedule == "guided":
+            size = max(size, -(-(ntasks - start) // (2 * self.ngroups)))
+        return range(start, min(start + size, ntasks))
+
+    def _dispatch(self, ntasks):
+        results = [None] * ntasks
+        start = 0
+        active = self.ngroups
+        while active > 0:
+            # a request carries the results of the previous chunk
+            source, done = self.comm.recv(tag=4)
+            for index, result in done:
+                results[index] = result
+            if start < ntasks:
+                chunk = self._next_chunk(start, ntasks)
+                start = chunk.stop
+            else:
+                # no tasks left, the group stops
+                chunk = None
+                active -= 1
+            self.comm.send(chunk, dest=source, tag=5)
+        return results
+
+    def _work(self, func):
+        done = []
+        while True:
+            chunk = None
+            if self.is_group_root():
+                self.comm.send((self.rank, done), dest=DynamicTaskScheduler._dispatch_rank, tag=4)
+                chunk = self.comm.recv(source=DynamicTaskScheduler._dispatch_rank, tag=5)
+            if self.work_comm is not None:
+                chunk = self.work_comm.bcast(chunk, root=0)
+            if chunk is None:
+                return None
+            done = []
+            for index in chunk:
+                result = _run_task(func, index, self.work_comm, self.rank)
+                if isinstance(result, TaskFailure) and self.is_group_root():
+                    print(f"{self.rank}: ({index}) skipping -> {result}")
+                done.append((index, result))
+
 
 def example_program():
     """This function demonstrates how to use the IOCoordinator classes."""
@@ -323,6 +2366,10 @@ def example_program():
     parser = argparse.ArgumentParser(allow_abbrev=False)
     parser.add_argument("--mpi", action="store_true", help="use mpi")
     parser.add_argument("--async-io", action="store_true", help="async io")
+    parser.add_argument("--prefetch", type=int, default=0, help="pipeline depth")
+    parser.add_argument("--ngroups", type=int, default=1, help="number of worker groups")
+    parser.add_argument("--nreaders", type=int, default=1, help="number of reader ranks")
+    parser.add_argument("--nwriters", type=int, default=1, help="number of writer ranks")
     args = parser.parse_args()
 
     # initialize IO coordinator based on arguments
@@ -330,7 +2377,13 @@ def example_program():
         from mpi4py import MPI
 
         if args.async_io:
-            coordinator = ParallelIOCoordinator(MPI.COMM_WORLD)
+            coordinator = ParallelIOCoordinator(
+                MPI.COMM_WORLD,
+                prefetch=args.prefetch,
+                ngroups=args.ngroups,
+                nreaders=args.nreaders,
+                nwriters=args.nwriters,
+            )
         else:
             coordinator = SerialIOCoordinator(MPI.COMM_WORLD)
     else:
@@ -339,31 +2392,21 @@ def example_program():
 
     # define example read/process/write functions
     def generate_numbers(task_index):
-        return [task_index for i in range(10)]
+        return np.full(10, task_index)
 
     def distributed_sum(numbers, comm):
-        # broadcast data
+        # scatter data
         if comm is not None:
-            numbers = comm.bcast(numbers, root=0)
-            numbers = numbers[comm.rank :: comm.size]
+            numbers = scatter(numbers, comm, root=0)
         # each rank computes a subtotal
-        subtotal = sum(numbers)
-        # gather subtotals
+        result = numbers.sum()
+        # combine subtotals on root
         if comm is not None:
-            subtotals = comm.gather(subtotal, root=0)
-        else:
-            subtotals = [
-                subtotal,
-            ]
-        # combine subtotals
-        if comm is not None and comm.rank > 0:
-            result = None
-        else:
-            result = sum(subtotals)
+            result = reduce(result, comm, root=0)
         return result
 
     def print_result(task_index, result):
-        print(f"{rank=} {task_index=} {result=}")
+        print(f"{rank=} {task_index=} result={result}")
 
     # iterate over tasks
     for task_index in range(5):
@@ -376,6 +2419,7 @@ def example_program():
         # print result
         coordinator.write(lambda result: print_result(task_index, result), result)
 
+    coordinator.close()
     if coordinator.comm is not None:
         coordinator.comm.barrier()
 
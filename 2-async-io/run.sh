@@ -2,6 +2,11 @@
 
 set -e
 
+# scratch space for the demo output, so reruns start from an empty cache and the source
+# tree stays clean
+scratch=$(mktemp -d)
+trap 'rm -rf "$scratch"' EXIT
+
 printf "\n### Part a\n"
 cmd="time python ex2-a-refactor.py"
 printf "> $cmd\n"
@@ -42,3 +47,139 @@ cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --async-io"
 printf "> $cmd\n"
 $cmd
 
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --async-io --prefetch 2"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 6 python ex2-c-async-again.py --mpi --async-io --ngroups 2"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 8 python ex2-c-async-again.py --mpi --async-io --ngroups 2 --nreaders 2 --nwriters 2"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time python ex2-c-async-again.py --background-io"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time python ex2-c-async-again.py --background-io --trigger-three"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 4 python ex2-c-async-again.py --mpi --async-io --prefetch 2 --timing $scratch/trace.json"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --async-io --chunk-size 3"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --layout block-cyclic --block-size 3"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --weights 1 2 3 4"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --layout shared"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --async-io --cache $scratch/cache"
+printf "> $cmd\n"
+$cmd
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 4 python ex2-c-async-again.py --mpi --async-io --trigger-one"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 4 python ex2-c-async-again.py --mpi --async-io --trigger-two"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --ntasks 6 --stragglers --slow-rank 3"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --ntasks 6 --rebalance --slow-rank 3"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-c-async-again.py --mpi --async-io --ntasks 8 --batch-size 4 --trigger-two"
+printf "> $cmd\n"
+$cmd
+
+printf "\n### Part d\n"
+cmd="time python ex2-d-dynamic.py"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 5 python ex2-d-dynamic.py --mpi"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 5 python ex2-d-dynamic.py --mpi --group-size 2"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 5 python ex2-d-dynamic.py --mpi --group-size 2 --trigger-one"
+printf "> $cmd\n"
+$cmd
+
+printf "\n### Part e\n"
+cmd="time python ex2-e-mpiio.py"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-e-mpiio.py --mpi"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-e-mpiio.py --mpi --layout block-cyclic --block-size 3"
+printf "> $cmd\n"
+$cmd
+
+printf "\n### Part f\n"
+cmd="time python ex2-f-asyncio.py"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-f-asyncio.py --mpi"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-f-asyncio.py --mpi --trigger-one"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="time mpiexec -n 4 python ex2-f-asyncio.py --mpi --trigger-two"
+printf "> $cmd\n"
+$cmd
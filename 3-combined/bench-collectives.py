@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Compares flat and hierarchical (node-aware) collectives over a range of payload sizes.
+
+Each collective is timed on the flat communicator and on a HierarchicalComm wrapping it.
+Rank 0 prints one CSV row per collective and size with the mean time of both and the
+speedup of the hierarchical variant, followed by the crossover point of each collective:
+the smallest payload from which on the hierarchical variant is faster.
+
+    mpiexec -n 8 python bench-collectives.py --mpi
+    mpiexec -n 8 python bench-collectives.py --mpi --ranks-per-node 4
+    python bench-collectives.py --local 8 --ranks-per-node 4
+
+On a single machine, --ranks-per-node emulates nodes so the two levels can be compared.
+"""
+
+import argparse
+import csv
+import sys
+import time
+
+import numpy as np
+
+from helpers import HierarchicalComm
+
+
+def measure(comm, op, payload, repeat):
+    """Returns the mean time of op(comm, payload) over repeat calls, maximum over ranks."""
+    comm.barrier()
+    start = time.perf_counter()
+    for i in range(repeat):
+        op(comm, payload)
+    elapsed = (time.perf_counter() - start) / repeat
+    return max(comm.allgather(elapsed))
+
+
+def bcast(comm, payload):
+    comm.bcast(payload if comm.rank == 0 else None, root=0)
+
+
+def gather(comm, payload):
+    comm.gather(payload, root=0)
+
+
+def allreduce(comm, payload):
+    comm.Allreduce(payload, np.empty_like(payload))
+
+
+OPS = {"bcast": bcast, "gather": gather, "allreduce": allreduce}
+
+
+def run(world, args):
+    hierarchical = HierarchicalComm(world, args.ranks_per_node)
+    rows = []
+    for name in args.ops:
+        for nbytes in args.sizes:
+            payload = np.ones(max(nbytes // 8, 1))
+            flat = measure(world, OPS[name], payload, args.repeat)
+            hier = measure(hierarchical, OPS[name], payload, args.repeat)
+            rows.append(
+                {
+                    "op": name,
+                    "bytes": nbytes,
+                    "flat": flat,
+                    "hierarchical": hier,
+                    "speedup": flat / hier,
+                }
+            )
+    if world.rank != 0:
+        return
+
+    writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    for name in args.ops:
+        # the smallest size from which on every larger size is faster
+        crossover = None
+        for row in sorted((r for r in rows if r["op"] == name), key=lambda r: -r["bytes"]):
+            if row["speedup"] <= 1:
+                break
+            crossover = row["bytes"]
+        if crossover is None:
+            print(f"# {name}: flat is faster at the largest size", file=sys.stderr)
+        else:
+            print(f"# {name}: hierarchical is faster from {crossover} bytes", file=sys.stderr)
+    sys.stdout.flush()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("--mpi", action="store_true", help="use mpi")
+    parser.add_argument("--local", type=int, default=0, help="use local processes instead of mpi")
+    parser.add_argument(
+        "--ranks-per-node", type=int, default=None, help="emulate nodes of this many ranks"
+    )
+    parser.add_argument("--ops", nargs="+", choices=list(OPS), default=list(OPS))
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[8, 1024, 65536, 1048576], help="payload bytes"
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="calls per measurement")
+    args = parser.parse_args()
+
+    if args.local > 0:
+        from localcomm import launch
+
+        raise SystemExit(launch(args.local, run, args))
+    elif args.mpi:
+        from mpi4py import MPI
+
+        run(MPI.COMM_WORLD, args)
+    else:
+        parser.error("run with --mpi or --local N")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 import argparse
+import functools
+import time
 
 from helpers import (
     MyModule,
@@ -9,88 +11,312 @@ from helpers import (
     AsyncIOComm,
     NoMPIComm,
     SafeMPIComm,
+    HierarchicalComm,
+    ResultCache,
+    TaskJournal,
+    RetryPolicy,
 )
 
 def main():
 
     parser = argparse.ArgumentParser(allow_abbrev=False)
     parser.add_argument("--mpi", action="store_true", help="use mpi")
+    parser.add_argument("--local", type=int, default=0, help="use local processes instead of mpi")
     parser.add_argument("--trigger-one", action="store_true", help="raise error")
     parser.add_argument("--trigger-two", action="store_true", help="raise error")
     parser.add_argument("--trigger-three", action="store_true", help="raise error")
+    parser.add_argument(
+        "--trigger-transient", action="store_true", help="raise a retryable error once"
+    )
     parser.add_argument("--async-io", action="store_true", help="async io")
+    parser.add_argument(
+        "--hierarchical", action="store_true", help="node-aware collectives between workers"
+    )
+    parser.add_argument(
+        "--ranks-per-node", type=int, default=None, help="emulate nodes of this many ranks"
+    )
+    parser.add_argument("--cache", help="directory to cache task results in")
+    parser.add_argument(
+        "--cache-size", type=int, default=2**30, help="maximum bytes of cached results"
+    )
+    parser.add_argument("--journal", help="file to record task outcomes in and resume from")
+    parser.add_argument(
+        "--retry-failed", action="store_true", help="only rerun the failed tasks in the journal"
+    )
+    for stage in RetryPolicy.STAGES:
+        parser.add_argument(
+            f"--{stage}-attempts", type=int, default=1, help=f"maximum attempts to {stage}"
+        )
+    parser.add_argument(
+        "--backoff", type=float, default=0.1, help="seconds to wait before the first retry"
+    )
+    parser.add_argument("--ntasks", type=int, default=3, help="number of tasks")
+    parser.add_argument(
+        "--batch-size", type=int, default=1, help="tasks to send in one message per stage"
+    )
     args = parser.parse_args()
+    if args.retry_failed and not args.journal:
+        parser.error("--retry-failed requires --journal")
+    if args.batch_size > 1:
+        retries = any(getattr(args, f"{stage}_attempts") > 1 for stage in RetryPolicy.STAGES)
+        if args.cache or retries:
+            parser.error("--batch-size does not work with --cache or retries")
 
     # optional mpi setup
-    if args.mpi:
+    if args.local > 0:
+        from localcomm import launch
+        raise SystemExit(launch(args.local, run, args))
+    elif args.mpi:
         from mpi4py import MPI
-        if args.async_io:
-            comm = AsyncIOComm(MPI.COMM_WORLD)
-        else:
-            comm = SyncIOComm(MPI.COMM_WORLD)
+        run(MPI.COMM_WORLD, args)
     else:
+        run(None, args)
+
+
+def run(world, args):
+
+    if world is None:
         comm = NoMPIIOComm()
+    elif args.async_io:
+        comm = AsyncIOComm(world)
+    else:
+        comm = SyncIOComm(world)
 
     rank, size = comm.rank, comm.size
 
+    # results only depend on the input and how it is processed
+    cache = None
+    if args.cache:
+        cache = ResultCache(args.cache, max_bytes=args.cache_size, params="process_data")
+
+    def load(mymod):
+        numbers = mymod.load_data(10)
+        if cache is None:
+            return None, False, numbers
+        # on a hit, the cached total replaces the numbers
+        key = cache.key(mymod.index, numbers)
+        hit, total = cache.get(key)
+        return key, hit, total if hit else numbers
+
+    # tasks whose write was attempted, so an error there is their own
+    attempted = set()
+
+    def write(mymod, key, hit, total):
+        attempted.add(mymod.index)
+        mymod.write_result(total)
+        # cache the result only once it was written successfully
+        if key is not None and not hit:
+            cache.put(key, total)
+
+    # splitting into nodes is collective, so do it once for all tasks
+    worker_comm = comm.work_comm
+    if worker_comm is not None and args.hierarchical:
+        worker_comm = HierarchicalComm(worker_comm, args.ranks_per_node)
+
     # say hello
     print(f"{rank}: Hello!")
     if comm.comm is not None:
         comm.comm.barrier()
 
-    # iterate over tasks
-    for i in range(3):
+    # on restart, the write rank decides which tasks are left and tells everyone
+    tasks = list(range(args.ntasks))
+    journal = None
+    if args.journal:
+        journal = TaskJournal(args.journal)
+        if rank == comm.WRITE_RANK:
+            tasks = journal.remaining(tasks, retry_failed=args.retry_failed)
+            print(f"{rank}: resuming with tasks {tasks}")
+        if comm.comm is not None:
+            tasks = comm.comm.bcast(tasks, root=comm.WRITE_RANK)
+    recording = journal is not None and rank == comm.WRITE_RANK
 
-        try:
-            mymod = MyModule(rank, size, i, args)
+    if args.batch_size > 1:
+        run_batches(comm, worker_comm, tasks, args, journal if recording else None)
+        if comm.comm is not None:
+            comm.comm.barrier()
+        return
 
-            # generate data
-            numbers = comm.read(lambda: mymod.load_data(10), None)
+    # failed tasks are requeued to another pass instead of being retried inline
+    policy = RetryPolicy(
+        {stage: getattr(args, f"{stage}_attempts") for stage in RetryPolicy.STAGES},
+        backoff=args.backoff,
+    )
+    attempts = dict.fromkeys(tasks, 0)
+    # when each requeued task may be read again
+    ready = {}
 
-            subtotals = None
-            if comm.is_worker():
+    def read(mymod):
+        # only the read rank waits out the backoff, so the other tasks carry on meanwhile
+        time.sleep(max(0.0, ready.get(mymod.index, 0.0) - time.monotonic()))
+        return load(mymod)
 
-                if comm.work_comm is not None:
-                    work_comm = SafeMPIComm(comm.work_comm)
-                else:
-                    work_comm = NoMPIComm()
+    while tasks:
+        # on the write rank, the requeued tasks and when to retry them
+        requeued = []
 
-                # broadcast data
-                # note: this is essentially a less efficient way to mpi scatter
-                numbers = work_comm.bcast(lambda: numbers, root=0)
-                numbers = numbers[work_comm.rank::work_comm.size]
+        # iterate over tasks
+        for i in tasks:
+            start = time.perf_counter()
+            attempted.discard(i)
+            failure = None
+            try:
+                mymod = MyModule(rank, size, i, args, attempts[i])
 
-                # gather subtotals
-                error = None
+                # generate data, or look up the cached result. a read error only reaches the
+                # worker root, which raises it in the first worker collective of the task
+                read_error = None
                 try:
-                    # each rank computes a subtotal
-                    subtotals = work_comm.gather(
-                        lambda: mymod.process_data(numbers), root=0
-                    )
+                    key, hit, numbers = comm.read(lambda: read(mymod), (None, False, None))
                 except Exception as e:
-                    # workers catch the error here so worker_root can send to write_rank
-                    error = e
-                
-                # send the error to write rank before it tries to write anything
-                if comm.is_worker_root() and isinstance(comm, AsyncIOComm):
-                    comm.comm.send(error, comm.WRITE_RANK, tag=0)
-
-                # workers re-raise error here
-                if error is not None:
-                    raise error
-
-            # sum subtotals and print result
-            comm.write(
-                lambda result: mymod.write_result(result), subtotals
-            )
+                    if not comm.is_worker_root():
+                        raise
+                    read_error, key, hit, numbers = e, None, False, None
 
-        except Exception as e:
-            print(f"{rank}: ({i}) skipping -> {type(e)} {e}")
-            continue
+                def loaded(value):
+                    if read_error is not None:
+                        raise read_error
+                    return value
+
+                total = None
+                if comm.is_worker():
+
+                    if comm.work_comm is not None:
+                        work_comm = SafeMPIComm(worker_comm)
+                    else:
+                        work_comm = NoMPIComm()
+
+                    error = None
+                    try:
+                        # cached tasks skip the work
+                        if cache is not None and work_comm.bcast(lambda: loaded(hit), root=0):
+                            total = numbers
+                        else:
+                            # scatter data
+                            numbers = work_comm.scatter(lambda: loaded(numbers), root=0)
+
+                            # each rank computes a subtotal, combine subtotals on root
+                            total = work_comm.reduce(lambda: mymod.process_data(numbers), root=0)
+                    except Exception as e:
+                        # workers catch the error here so worker_root can send to write_rank
+                        error = e
+
+                    # workers re-raise error here, the worker root first hands it to
+                    # the write rank in place of the result, with the stage that failed
+                    if error is not None:
+                        if comm.is_worker_root():
+                            if read_error is not None:
+                                error = policy.stage_error("read", read_error)
+                            else:
+                                error = policy.stage_error("process", error)
+                            comm.write(None, None, error=error)
+                        raise error
+
+                # print result, the cache key travels with it to the write rank
+                comm.write(
+                    lambda result: write(mymod, *result), (key, hit, total)
+                )
+
+            except Exception as e:
+                failure = e
+
+            if failure is not None and rank != comm.WRITE_RANK:
+                print(f"{rank}: ({i}) failed -> {type(failure)} {failure}")
+                continue
+
+            if failure is not None:
+                # the write rank sees the outcome of every task, so it decides alone
+                if i in attempted:
+                    stage, retryable = "write", policy.is_retryable(failure)
+                else:
+                    stage = getattr(failure, "stage", "read")
+                    retryable = getattr(failure, "retryable", False)
+                delay = policy.retry(i, stage, retryable)
+                if delay is not None:
+                    print(f"{rank}: ({i}) requeueing in {delay:.2f}s -> {type(failure)} {failure}")
+                    requeued.append((i, time.monotonic() + delay))
+                    continue
+                print(f"{rank}: ({i}) skipping -> {type(failure)} {failure}")
+
+            if recording:
+                # failed tasks broke while writing, skipped ones never got there
+                status = TaskJournal.DONE
+                if failure is not None:
+                    status = TaskJournal.FAILED if i in attempted else TaskJournal.SKIPPED
+                journal.record(i, status, time.perf_counter() - start, error=failure)
+
+        # like on restart, the write rank tells everyone which tasks are left, with the
+        # backoff that remains of each, since clocks differ between nodes
+        now = time.monotonic()
+        requeued = [(i, max(0.0, retry - now)) for i, retry in requeued]
+        if comm.comm is not None:
+            requeued = comm.comm.bcast(requeued, root=comm.WRITE_RANK)
+        now = time.monotonic()
+        tasks = [i for i, delay in requeued]
+        for i, delay in requeued:
+            attempts[i] += 1
+            ready[i] = now + delay
 
     if comm.comm is not None:
         comm.comm.barrier()
 
 
+def run_batches(comm, worker_comm, tasks, args, journal=None):
+    """Runs the tasks in batches of args.batch_size. Each stage handles a whole batch with one
+    message or collective round, and the errors of each task travel with its data, so one
+    bad task doesn't fail the rest of its batch.
+    """
+    rank, size = comm.rank, comm.size
+
+    def attempt(func):
+        try:
+            return None, func()
+        except Exception as e:
+            return e, None
+
+    def process(mymod, error, numbers):
+        # a task that failed to load fails on every worker
+        if error is not None:
+            raise error
+        return mymod.process_data(numbers)
+
+    def write(mymods, results, start):
+        for mymod, (error, total) in zip(mymods, results):
+            # failed tasks broke while writing, skipped ones never got there
+            status = TaskJournal.SKIPPED
+            if error is None:
+                status = TaskJournal.FAILED
+                error, _ = attempt(lambda: mymod.write_result(total))
+            if error is not None:
+                print(f"{rank}: ({mymod.index}) skipping -> {type(error)} {error}")
+            if journal is not None:
+                status = TaskJournal.DONE if error is None else status
+                journal.record(mymod.index, status, time.perf_counter() - start, error=error)
+
+    for first in range(0, len(tasks), args.batch_size):
+        start = time.perf_counter()
+        mymods = [MyModule(rank, size, i, args) for i in tasks[first : first + args.batch_size]]
+
+        # generate data for the whole batch, an error only fails its own task
+        loaded = comm.read(lambda: [attempt(lambda: m.load_data(10)) for m in mymods], None)
+
+        results = None
+        if comm.is_worker():
+
+            if comm.work_comm is not None:
+                work_comm = SafeMPIComm(worker_comm)
+            else:
+                work_comm = NoMPIComm()
+
+            # scatter data and combine subtotals on root, one round for all tasks
+            shares = work_comm.scatter_batch(lambda: loaded, root=0)
+            results = work_comm.reduce_batch(
+                [functools.partial(process, m, *share) for m, share in zip(mymods, shares)],
+                root=0,
+            )
+
+        # print results
+        comm.write(lambda results: write(mymods, results, start), results)
+
+
 if __name__ == "__main__":
     main()
@@ -1,5 +1,14 @@
+from abc import ABC, abstractmethod
+from array import array
+import hashlib
+import json
+import operator
+import os
+import pickle
 import time
 
+import numpy as np
+
 class NoMPIComm(object):
     def __init__(self):
         self.comm = None
@@ -9,12 +18,121 @@ class NoMPIComm(object):
     def bcast(self, rootfunc, root=0):
         return rootfunc()
 
+    def scatter(self, rootfunc, root=0, layout="strided"):
+        return rootfunc()
+
     def gather(self, rankfunc, root=0):
         return [rankfunc(), ]
 
+    def reduce(self, rankfunc, root=0, combine=None):
+        return rankfunc()
+
+    def scatter_batch(self, rootfunc, root=0, layout="strided"):
+        return rootfunc()
+
+    def reduce_batch(self, rankfuncs, root=0):
+        results = []
+        for rankfunc in rankfuncs:
+            try:
+                results.append((None, rankfunc()))
+            except Exception as e:
+                results.append((e, None))
+        return results
+
     def barrier(self, rankfunc):
         rankfunc()
 
+    def ibcast(self, rootfunc, root=0):
+        return CompletedRequest(rootfunc)
+
+    def igather(self, rankfunc, root=0):
+        return CompletedRequest(lambda: [rankfunc(), ])
+
+    def ibarrier(self, rankfunc):
+        return CompletedRequest(rankfunc)
+
+
+class CompletedRequest(object):
+    def __init__(self, func):
+        """A request that is complete on creation. Returned by the nonblocking NoMPIComm methods.
+
+        Args:
+            func: a callable with no arguments. called immediately, any error is raised by wait().
+        """
+        self.result = None
+        self.error = None
+        try:
+            self.result = func()
+        except Exception as e:
+            self.error = e
+
+    def test(self):
+        return True, self.wait()
+
+    def wait(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SafeRequest(object):
+    def __init__(self, stages):
+        """A request returned by the nonblocking SafeMPIComm methods.
+
+        A safe collective runs in stages: the ranks agree on the error status while the sizes
+        of the pickled payloads are exchanged, then the payloads are moved. stages is a generator
+        that yields the MPI requests of each stage and returns the result of the collective.
+
+        Args:
+            stages: a generator yielding lists of MPI requests.
+        """
+        self._stages = stages
+        self._requests = next(stages)
+        self._done = False
+        self._result = None
+        self._error = None
+
+    def _advance(self):
+        try:
+            self._requests = self._stages.send(None)
+        except StopIteration as e:
+            self._done = True
+            self._result = e.value
+        except Exception as e:
+            self._done = True
+            self._error = e
+
+    def test(self):
+        """Advances the collective without blocking.
+
+        Returns:
+            (flag, result): flag is True once the collective is complete, in which case result
+                is the same as the result of wait().
+        """
+        from mpi4py import MPI
+
+        while not self._done and MPI.Request.Testall(self._requests):
+            self._advance()
+        if not self._done:
+            return False, None
+        return True, self.wait()
+
+    def wait(self):
+        """Blocks until the collective is complete. Raises a RuntimeError on all ranks if any
+        rank caught an error.
+
+        Returns:
+            result: the result of the matching blocking collective.
+        """
+        from mpi4py import MPI
+
+        while not self._done:
+            MPI.Request.Waitall(self._requests)
+            self._advance()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
 
 class SafeMPIComm(object):
     def __init__(self, comm):
@@ -33,14 +151,30 @@ class SafeMPIComm(object):
             # only root catches error here
             error = e
 
-        # check for error
-        error = self.comm.bcast(error, root=root)
+        # the error travels with the data in a single bcast
+        error, obj = self.comm.bcast((error, obj), root=root)
         # handle the error on all ranks
         if error is not None:
             msg = f"{self.rank}: caught error before bcast!"
             raise RuntimeError(msg) from error
 
-        return self.comm.bcast(obj, root=root)
+        return obj
+
+    def scatter(self, rootfunc, root=0, layout="strided"):
+        # only root rank calls rootfunc
+        obj = None
+        error = None
+        try:
+            if self.rank == root:
+                obj = rootfunc()
+        except Exception as e:
+            # only root catches error here
+            error = e
+
+        # check for error
+        self._check(error, "scatter")
+
+        return scatter(obj, self.comm, root=root, layout=layout)
 
     def gather(self, rankfunc, root=0):
         # all ranks call rankfunc
@@ -52,15 +186,78 @@ class SafeMPIComm(object):
             error = e
 
         # check for error
-        errors = self.comm.allgather(error)
-        # handle the error(s) on all ranks
-        for error in errors:
-            if error is not None:
-                msg = f"{self.rank}: caught error before gather"
-                raise RuntimeError(msg) from error
+        self._check(error, "gather")
 
         return self.comm.gather(sendobj, root=root)
 
+    def reduce(self, rankfunc, root=0, combine=None):
+        # all ranks call rankfunc
+        error = None
+        try:
+            sendobj = rankfunc()
+        except Exception as e:
+            # only ranks with an error catch here
+            error = e
+
+        # check for error
+        self._check(error, "reduce")
+
+        return reduce(sendobj, self.comm, root=root, combine=combine)
+
+    def scatter_batch(self, rootfunc, root=0, layout="strided"):
+        """Scatters the inputs of a batch of tasks in one round, see scatter_batch(). Only
+        root calls rootfunc, which returns an (error, data) pair per task so a task that
+        failed to load doesn't fail the batch.
+
+        Returns:
+            shares: an (error, share) pair per task. share is None if error is set.
+        """
+        # only root rank calls rootfunc
+        outcomes = None
+        error = None
+        try:
+            if self.rank == root:
+                outcomes = rootfunc()
+        except Exception as e:
+            # only root catches error here
+            error = e
+
+        # check for error
+        self._check(error, "scatter")
+
+        return scatter_batch(outcomes, self.comm, root=root, layout=layout)
+
+    def reduce_batch(self, rankfuncs, root=0):
+        """Sums one numeric value per task of a batch onto root in one round. All ranks call
+        every rankfunc. Unlike reduce(), an error only fails its own task: the ranks agree on
+        the failed tasks with one status check for the whole batch, and the values of all
+        tasks are reduced together with one buffer-based Reduce.
+
+        Returns:
+            results: an (error, total) pair per task. error is a RuntimeError raised from the
+                task's error on all ranks, or None. total is None if error is set or off root.
+        """
+        # all ranks call every rankfunc
+        values = []
+        errors = []
+        for rankfunc in rankfuncs:
+            try:
+                values.append(rankfunc())
+                errors.append(None)
+            except Exception as e:
+                # only the failed task of ranks with an error is affected
+                values.append(0)
+                errors.append(e)
+
+        # check for errors of each task
+        errors = self._check_batch(errors, "reduce")
+
+        totals = reduce(np.asarray(values), self.comm, root=root)
+        return [
+            (error, None if error is not None or totals is None else totals[task])
+            for task, error in enumerate(errors)
+        ]
+
     def barrier(self, rankfunc):
         # all ranks call rankfunc
         error = None
@@ -71,24 +268,836 @@ class SafeMPIComm(object):
             error = e
 
         # check for error
-        errors = self.comm.allgather(error)
+        # the status check already synchronizes all ranks
+        self._check(error, "barrier")
+
+    def ibcast(self, rootfunc, root=0):
+        """Nonblocking variant of bcast. Only root calls rootfunc, before returning.
+
+        Returns:
+            request: a SafeRequest whose wait() returns the broadcast object.
+        """
+        return SafeRequest(self._ibcast(rootfunc, root))
+
+    def igather(self, rankfunc, root=0):
+        """Nonblocking variant of gather. All ranks call rankfunc, before returning.
+
+        Returns:
+            request: a SafeRequest whose wait() returns the gathered list on root and None
+                on other ranks.
+        """
+        return SafeRequest(self._igather(rankfunc, root))
+
+    def ibarrier(self, rankfunc):
+        """Nonblocking variant of barrier. All ranks call rankfunc, before returning.
+
+        Returns:
+            request: a SafeRequest whose wait() returns None.
+        """
+        return SafeRequest(self._ibarrier(rankfunc))
+
+    def _ibcast(self, rootfunc, root):
+        from mpi4py import MPI
+
+        # only root rank calls rootfunc
+        obj = None
+        error = None
+        try:
+            if self.rank == root:
+                obj = rootfunc()
+        except Exception as e:
+            # only root catches error here
+            error = e
+
+        # the error travels with the data, the size goes first
+        data = None
+        nbytes = array("q", [0])
+        if self.rank == root:
+            data = bytearray(MPI.pickle.dumps((error, obj)))
+            nbytes[0] = len(data)
+        yield [self.comm.Ibcast(nbytes, root=root)]
+        if self.rank != root:
+            data = bytearray(nbytes[0])
+        yield [self.comm.Ibcast(data, root=root)]
+
+        # handle the error on all ranks
+        error, obj = MPI.pickle.loads(data)
+        if error is not None:
+            msg = f"{self.rank}: caught error before bcast!"
+            raise RuntimeError(msg) from error
+
+        return obj
+
+    def _igather(self, rankfunc, root):
+        from mpi4py import MPI
+
+        # all ranks call rankfunc
+        error = None
+        data = bytearray()
+        try:
+            data = bytearray(MPI.pickle.dumps(rankfunc()))
+        except Exception as e:
+            # only ranks with an error catch here
+            error = e
+
+        # check for error while the payload sizes are gathered
+        status = array("i", [0 if error is None else 1])
+        nfailed = array("i", [0])
+        nbytes = array("q", [len(data)])
+        sizes = array("q", [0] * self.size) if self.rank == root else None
+        yield [
+            self.comm.Iallreduce(status, nfailed),
+            self.comm.Igather(nbytes, sizes, root=root),
+        ]
+        if nfailed[0] != 0:
+            yield from self._iraise(error, "gather")
+
+        recvbuf = None
+        if self.rank == root:
+            counts, displs = list(sizes), [sum(sizes[:rank]) for rank in range(self.size)]
+            recvbuf = bytearray(sum(counts))
+        yield [
+            self.comm.Igatherv(
+                data, None if recvbuf is None else [recvbuf, (counts, displs)], root=root
+            )
+        ]
+
+        if self.rank != root:
+            return None
+        return [
+            MPI.pickle.loads(recvbuf[displ : displ + count])
+            for count, displ in zip(counts, displs)
+        ]
+
+    def _ibarrier(self, rankfunc):
+        # all ranks call rankfunc
+        error = None
+        try:
+            rankfunc()
+        except Exception as e:
+            # only ranks with an error catch here
+            error = e
+
+        # the status check already synchronizes all ranks
+        status = array("i", [0 if error is None else 1])
+        nfailed = array("i", [0])
+        yield [self.comm.Iallreduce(status, nfailed)]
+        if nfailed[0] != 0:
+            yield from self._iraise(error, "barrier")
+
+    def _check(self, error, where):
+        """Raises a RuntimeError on all ranks if any rank caught an error.
+
+        The ranks first agree on the number of failed ranks with a buffer-based Allreduce of a
+        single integer. The pickled errors are only gathered when that number is nonzero.
+        """
+        status = array("i", [0 if error is None else 1])
+        nfailed = array("i", [0])
+        self.comm.Allreduce(status, nfailed)
+        if nfailed[0] != 0:
+            self._raise(error, where)
+
+    def _check_batch(self, errors, where):
+        """Returns a RuntimeError on all ranks for every task in which any rank caught an
+        error, and None for the other tasks.
+
+        Like _check(), the ranks agree on the number of failed ranks of each task with one
+        Allreduce, and only gather the errors of the failed tasks.
+        """
+        status = array("i", [0 if error is None else 1 for error in errors])
+        nfailed = array("i", [0] * len(errors))
+        self.comm.Allreduce(status, nfailed)
+        failed = [task for task, n in enumerate(nfailed) if n != 0]
+        results = [None] * len(errors)
+        if not failed:
+            return results
+        gathered = self.comm.allgather([errors[task] for task in failed])
+        for i, task in enumerate(failed):
+            # the first error of the task on any rank
+            cause = next(rank_errors[i] for rank_errors in gathered if rank_errors[i] is not None)
+            results[task] = RuntimeError(f"{self.rank}: caught error before {where}")
+            results[task].__cause__ = cause
+        return results
+
+    def _iraise(self, error, where):
+        """Nonblocking variant of _raise() for the stages of a SafeRequest. The sizes of the
+        pickled errors are exchanged with an Iallgather and the errors with an Iallgatherv,
+        so test() never blocks on the error path either.
+        """
+        from mpi4py import MPI
+
+        data = bytearray(MPI.pickle.dumps(error))
+        nbytes = array("q", [len(data)])
+        sizes = array("q", [0] * self.size)
+        yield [self.comm.Iallgather(nbytes, sizes)]
+
+        counts, displs = list(sizes), [sum(sizes[:rank]) for rank in range(self.size)]
+        recvbuf = bytearray(sum(counts))
+        yield [self.comm.Iallgatherv(data, [recvbuf, (counts, displs)])]
+
+        # handle the error(s) on all ranks
+        for count, displ in zip(counts, displs):
+            error = MPI.pickle.loads(recvbuf[displ : displ + count])
+            if error is not None:
+                msg = f"{self.rank}: caught error before {where}"
+                raise RuntimeError(msg) from error
+
+    def _raise(self, error, where):
+        """Gathers the errors from all ranks and raises the first one on all ranks."""
         # handle the error(s) on all ranks
-        for error in errors:
+        for error in self.comm.allgather(error):
             if error is not None:
-                msg = f"{self.rank}: caught error before barrier"
+                msg = f"{self.rank}: caught error before {where}"
                 raise RuntimeError(msg) from error
 
-        self.comm.barrier()
+
+class HierarchicalComm(object):
+    def __init__(self, comm, ranks_per_node=None):
+        """A node-aware communicator that runs collectives in two levels.
+
+        The ranks are split into one node communicator per node and one leader communicator
+        between the first rank of every node. A collective first moves data within the nodes,
+        where MPI uses shared memory, and only the leaders talk across the network. It provides
+        the collectives used by SafeMPIComm, so SafeMPIComm(HierarchicalComm(comm)) keeps the
+        same error handling. Other methods and attributes are passed through to comm.
+
+        Args:
+            comm: an MPI communicator.
+            ranks_per_node: group consecutive ranks into nodes of this size instead of
+                detecting which ranks share memory. useful to emulate nodes on one machine.
+        """
+        self.comm = comm
+        self.rank = comm.rank
+        self.size = comm.size
+        if ranks_per_node is None:
+            from mpi4py import MPI
+
+            self.node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.rank)
+        else:
+            self.node_comm = comm.Split(comm.rank // ranks_per_node, key=comm.rank)
+        # every rank joins a split, only the leaders keep theirs
+        is_leader = self.node_comm.rank == 0
+        leader_comm = comm.Split(0 if is_leader else 1, key=comm.rank)
+        self.leader_comm = leader_comm if is_leader else None
+        if not is_leader:
+            leader_comm.Free()
+
+        # the world ranks of each node, nodes ordered by their leader
+        leader = self.node_comm.bcast(comm.rank, root=0)
+        leaders = comm.allgather(leader)
+        self.nodes = [
+            [rank for rank in range(self.size) if leaders[rank] == node_leader]
+            for node_leader in sorted(set(leaders))
+        ]
+        self.node = next(i for i, members in enumerate(self.nodes) if comm.rank in members)
+
+    def __getattr__(self, name):
+        return getattr(self.comm, name)
+
+    def _locate(self, rank):
+        """Returns the node of rank and its rank in the node communicator."""
+        for node, members in enumerate(self.nodes):
+            if rank in members:
+                return node, members.index(rank)
+
+    def bcast(self, obj, root=0):
+        node, node_root = self._locate(root)
+        # root's node first, then the leaders, then the other nodes
+        if self.node == node:
+            obj = self.node_comm.bcast(obj, root=node_root)
+        if self.leader_comm is not None:
+            obj = self.leader_comm.bcast(obj, root=node)
+        if self.node != node:
+            obj = self.node_comm.bcast(obj, root=0)
+        return obj
+
+    def gather(self, sendobj, root=0):
+        node, node_root = self._locate(root)
+        # each leader collects its node, root's leader collects the leaders
+        values = self.node_comm.gather(sendobj, root=0)
+        if self.leader_comm is not None:
+            values = self.leader_comm.gather(values, root=node)
+        if node_root != 0 and self.node == node:
+            # hand over to root if it is not the leader
+            if self.node_comm.rank == 0:
+                self.node_comm.send(values, dest=node_root, tag=0)
+            elif self.rank == root:
+                values = self.node_comm.recv(source=0, tag=0)
+        if self.rank != root:
+            return None
+        result = [None] * self.size
+        for members, node_values in zip(self.nodes, values):
+            for rank, value in zip(members, node_values):
+                result[rank] = value
+        return result
+
+    def allgather(self, sendobj):
+        return self.bcast(self.gather(sendobj, root=0), root=0)
+
+    def Reduce(self, sendbuf, recvbuf, root=0):
+        """Sums buffers elementwise onto root, like the default op of MPI Reduce."""
+        node, node_root = self._locate(root)
+        partial = self._reduce_node(sendbuf)
+        if self.leader_comm is not None:
+            total = np.empty_like(partial) if self.node == node else None
+            self.leader_comm.Reduce(partial, total, root=node)
+            partial = total
+        if node_root != 0 and self.node == node:
+            # hand over to root if it is not the leader
+            if self.node_comm.rank == 0:
+                self.node_comm.send(partial, dest=node_root, tag=0)
+            elif self.rank == root:
+                partial = self.node_comm.recv(source=0, tag=0)
+        if self.rank == root:
+            np.asarray(memoryview(recvbuf))[...] = partial
+
+    def Allreduce(self, sendbuf, recvbuf):
+        """Sums buffers elementwise, like the default op of MPI Allreduce."""
+        sendbuf = np.asarray(memoryview(sendbuf))
+        partial = self._reduce_node(sendbuf)
+        if self.leader_comm is not None:
+            total = np.empty_like(partial)
+            self.leader_comm.Allreduce(partial, total)
+            partial = total
+        else:
+            partial = np.empty_like(sendbuf)
+        self.node_comm.Bcast(partial, root=0)
+        np.asarray(memoryview(recvbuf))[...] = partial
+
+    def barrier(self):
+        self.node_comm.barrier()
+        if self.leader_comm is not None:
+            self.leader_comm.barrier()
+        self.node_comm.barrier()
+
+    def Barrier(self):
+        self.barrier()
+
+    def Free(self):
+        self.node_comm.Free()
+        if self.leader_comm is not None:
+            self.leader_comm.Free()
+
+    def _reduce_node(self, sendbuf):
+        """Sums sendbuf over the node onto its leader. Returns the partial sum on the leader."""
+        sendbuf = np.asarray(memoryview(sendbuf))
+        partial = np.empty_like(sendbuf) if self.node_comm.rank == 0 else None
+        self.node_comm.Reduce(sendbuf, partial, root=0)
+        return partial
+
+
+def decompose(n, size, weights=None):
+    """Returns the per-rank counts and displacements for dividing n items between size ranks.
+    The counts are the same for the strided and contiguous layouts. With weights, the counts
+    are proportional to the weight of each rank instead.
+    """
+    if weights is None:
+        counts = [n // size + (1 if rank < n % size else 0) for rank in range(size)]
+    else:
+        # largest remainder rounding, so the counts add up to n
+        shares = [n * weight / sum(weights) for weight in weights]
+        counts = [int(share) for share in shares]
+        order = sorted(range(size), key=lambda rank: counts[rank] - shares[rank])
+        for rank in order[: n - sum(counts)]:
+            counts[rank] += 1
+    displs = [sum(counts[:rank]) for rank in range(size)]
+    return counts, displs
+
+
+def scatter(data, comm, root=0, layout="strided"):
+    """Scatters data from root so each rank receives only its own share.
+
+    NumPy arrays are sent with a buffer-based Scatterv using the counts and displacements
+    of the partitioner (zero-copy when each rank gets a block of consecutive items).
+    Other payloads fall back to a pickle-based scatter of per-rank slices.
+
+    Args:
+        data: the data to scatter on root. ignored on other ranks.
+        comm: an MPI communicator.
+        root: the rank that holds data.
+        layout: a Partitioner, the same on all ranks, or the name of one: "strided" to give
+            rank r the items r, r + size, ... or "contiguous" to give each rank one block of
+            consecutive items.
+
+    Returns:
+        result: this rank's share of data.
+    """
+    partitioner = _partitioner(layout)
+    # agree on the path with a small header
+    header = None
+    if comm.rank == root and isinstance(data, np.ndarray):
+        header = (data.dtype.str, len(data))
+    header = comm.bcast(header, root=root)
+    if header is None:
+        chunks = None
+        if comm.rank == root:
+            chunks = [partitioner.share(data, rank, comm.size) for rank in range(comm.size)]
+        return comm.scatter(chunks, root=root)
+
+    dtype, n = header
+    counts, displs = partitioner.decompose(n, comm.size)
+    sendbuf = None
+    if comm.rank == root:
+        indices = partitioner.indices(n, comm.size)
+        if indices is not None:
+            # pack the shares one after another
+            data = data[indices]
+        sendbuf = [np.ascontiguousarray(data), (counts, displs)]
+    recvbuf = np.empty(counts[comm.rank], dtype=dtype)
+    comm.Scatterv(sendbuf, recvbuf, root=root)
+    return recvbuf
+
+
+class Partitioner(ABC):
+    """A Partitioner decides which items of a task each rank processes. It describes the
+    shares with the counts and displacements of Scatterv and Gatherv, over the items in
+    packed order: the share of rank 0 first, then the share of rank 1 and so on.
+
+    Subclasses implement decompose(). Those whose shares are not blocks of consecutive items
+    also implement indices(), the item order that packs the shares. The items each rank
+    gets differ between partitioners, but every item is processed by exactly one rank, so a
+    reduction gives the same result whichever partitioner is used.
+    """
+
+    @abstractmethod
+    def decompose(self, n, size):
+        """Returns the counts and displacements of the shares of n items between size ranks."""
+        raise NotImplementedError()
+
+    def indices(self, n, size):
+        """Returns the item indices in packed order, or None if packing keeps the item order,
+        in which case the shares are sent straight from the data without a copy.
+        """
+        return None
+
+    def share(self, data, rank, size):
+        """Returns the share of a sliceable data object that belongs to rank."""
+        counts, displs = self.decompose(len(data), size)
+        start, stop = displs[rank], displs[rank] + counts[rank]
+        indices = self.indices(len(data), size)
+        if indices is None:
+            return data[start:stop]
+        if isinstance(data, np.ndarray):
+            return data[indices[start:stop]]
+        return [data[i] for i in indices[start:stop]]
+
+
+class BlockPartitioner(Partitioner):
+    """Gives each rank one block of consecutive items, as even as possible."""
+
+    def decompose(self, n, size):
+        return decompose(n, size)
+
+
+class CyclicPartitioner(Partitioner):
+    def __init__(self, block=1):
+        """A CyclicPartitioner deals blocks of consecutive items to the ranks in turn: rank r
+        gets the blocks r, r + size, ... With block=1 this is the strided layout.
+
+        Args:
+            block: the number of consecutive items in a block.
+        """
+        assert block >= 1, "block must be positive"
+        self.block = block
+
+    def decompose(self, n, size):
+        counts = np.bincount(self._owners(n, size), minlength=size).tolist()
+        displs = [sum(counts[:rank]) for rank in range(size)]
+        return counts, displs
+
+    def indices(self, n, size):
+        return np.argsort(self._owners(n, size), kind="stable")
+
+    def share(self, data, rank, size):
+        if self.block == 1:
+            return data[rank::size]
+        return super().share(data, rank, size)
+
+    def _owners(self, n, size):
+        """Returns the rank that gets each item."""
+        return np.arange(n) // self.block % size
+
+
+class WeightedPartitioner(Partitioner):
+    def __init__(self, weights):
+        """A WeightedPartitioner gives each rank one block of consecutive items whose size is
+        proportional to the rank's weight. Weights are speeds or capacities, not costs: a rank
+        with twice the weight gets twice the items. To balance per-item costs, pass their
+        inverses.
+
+        Args:
+            weights: one nonnegative weight per rank, the same on all ranks.
+        """
+        assert sum(weights) > 0, "at least one weight must be positive"
+        self.weights = list(weights)
+
+    def decompose(self, n, size):
+        assert len(self.weights) == size, "there must be one weight per rank"
+        return decompose(n, size, self.weights)
+
+
+class CustomPartitioner(Partitioner):
+    def __init__(self, func):
+        """A CustomPartitioner gives each rank one block of consecutive items with the sizes
+        returned by a user function.
+
+        Args:
+            func: a callable that takes the number of items and ranks and returns the count
+                of each rank. it must return the same counts on all ranks.
+        """
+        self.func = func
+
+    def decompose(self, n, size):
+        counts = list(self.func(n, size))
+        assert len(counts) == size and sum(counts) == n, "counts must split n items"
+        displs = [sum(counts[:rank]) for rank in range(size)]
+        return counts, displs
+
+
+_PARTITIONERS = {"strided": CyclicPartitioner, "contiguous": BlockPartitioner}
+
+
+def _partitioner(layout):
+    """Returns the Partitioner for a layout name, or layout itself if it is one."""
+    if isinstance(layout, Partitioner):
+        return layout
+    assert layout in _PARTITIONERS, f"unknown layout {layout}"
+    return _PARTITIONERS[layout]()
+
+
+def scatter_batch(outcomes, comm, root=0, layout="strided"):
+    """Scatters the inputs of a batch of tasks from root with one bcast and one Scatterv,
+    instead of one round of each per task. Each task is divided by the partitioner on its
+    own, and the shares of all tasks for a rank are sent as one block.
+
+    Args:
+        outcomes: on root, an (error, data) pair per task, where data is a 1-d NumPy array
+            unless error is set. the arrays must have the same dtype. ignored on other ranks.
+        comm: an MPI communicator.
+        root: the rank that holds outcomes.
+        layout: a Partitioner or the name of one, as in scatter().
+
+    Returns:
+        shares: an (error, share) pair per task, with this rank's share of each task. share
+            is None if error is set.
+    """
+    partitioner = _partitioner(layout)
+    # the errors travel with the task sizes in a single bcast
+    header = None
+    if comm.rank == root:
+        dtype = next((data.dtype.str for error, data in outcomes if error is None), None)
+        sizes = [(error, None if error is not None else len(data)) for error, data in outcomes]
+        header = (dtype, sizes)
+    dtype, sizes = comm.bcast(header, root=root)
+
+    counts = [
+        [0] * comm.size if error is not None else partitioner.decompose(n, comm.size)[0]
+        for error, n in sizes
+    ]
+    recvbuf = None
+    if dtype is not None:
+        totals = [sum(task_counts[rank] for task_counts in counts) for rank in range(comm.size)]
+        sendbuf = None
+        if comm.rank == root:
+            # pack the shares of all tasks for each rank one after another
+            shares = [
+                partitioner.share(data, rank, comm.size)
+                for rank in range(comm.size)
+                for error, data in outcomes
+                if error is None
+            ]
+            displs = [sum(totals[:rank]) for rank in range(comm.size)]
+            sendbuf = [np.ascontiguousarray(np.concatenate(shares)), (totals, displs)]
+        recvbuf = np.empty(totals[comm.rank], dtype=dtype)
+        comm.Scatterv(sendbuf, recvbuf, root=root)
+
+    # split this rank's block back into tasks
+    shares = []
+    start = 0
+    for (error, n), task_counts in zip(sizes, counts):
+        if error is not None:
+            shares.append((error, None))
+            continue
+        stop = start + task_counts[comm.rank]
+        shares.append((None, recvbuf[start:stop]))
+        start = stop
+    return shares
+
+
+def reduce(value, comm, root=0, combine=None):
+    """Combines the values of all ranks into a single value on root.
+
+    With the default combine, scalars and numeric arrays are summed elementwise with a
+    buffer-based Reduce. Any other value, or a custom combine, is merged along a binomial
+    tree: in each of the ceil(log2(size)) rounds half of the remaining ranks send their
+    partial result to a partner, which combines it with its own. No rank ever holds more than
+    two values, unlike gathering every value on root.
+
+    Args:
+        value: this rank's value. all ranks must pass values of the same type.
+        comm: an MPI communicator.
+        root: the rank that receives the result.
+        combine: an associative callable combine(a, b) returning the merged value. values
+            are combined in rank order when root is 0. defaults to addition.
+
+    Returns:
+        result: the combined value on root, None on other ranks.
+    """
+    numeric = np.isscalar(value) or isinstance(value, np.ndarray)
+    if combine is None and numeric and np.asarray(value).dtype.kind in "biufc":
+        sendbuf = np.asarray(value, order="C")
+        recvbuf = np.empty_like(sendbuf) if comm.rank == root else None
+        comm.Reduce(sendbuf, recvbuf, root=root)
+        return None if recvbuf is None else recvbuf[()]
+
+    if combine is None:
+        combine = operator.add
+    # ranks relative to root so root is the last rank standing
+    rank = (comm.rank - root) % comm.size
+    mask = 1
+    while mask < comm.size:
+        if rank & mask:
+            # hand the partial result to the partner and drop out
+            comm.send(value, dest=(rank - mask + root) % comm.size, tag=6)
+            return None
+        if rank + mask < comm.size:
+            value = combine(value, comm.recv(source=(rank + mask + root) % comm.size, tag=6))
+        mask <<= 1
+    return value
+
+
+class ResultCache(object):
+    def __init__(self, directory, max_bytes=2**30, params=None):
+        """A ResultCache keeps task results on disk so reruns can skip tasks that already
+        succeeded. Results are keyed by the task index, a hash of the task input and params,
+        so a task is recomputed when its input or the parameters change.
+
+        Each result is pickled to its own file in directory, which must be visible to the
+        ranks that look up and store results. When the files exceed max_bytes, the least
+        recently used results are evicted.
+
+        Args:
+            directory: the cache directory. created if needed.
+            max_bytes: the maximum total size of the cached results.
+            params: a picklable value with the parameters that affect the results.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.params = pickle.dumps(params)
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, index, data):
+        """Returns the key of the result of task index with input data."""
+        digest = hashlib.sha256(pickle.dumps(index) + self.params)
+        if isinstance(data, np.ndarray):
+            digest.update(pickle.dumps((data.dtype.str, data.shape)))
+            digest.update(np.ascontiguousarray(data).data)
+        else:
+            digest.update(pickle.dumps(data))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns (True, result) if the result of key is cached and (False, None) otherwise."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            # the modification time is the LRU clock
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        return True, result
+
+    def put(self, key, result):
+        """Stores the result of key, then evicts results until the cache fits in max_bytes."""
+        path = self._path(key)
+        # write to a temporary file first so a reader never sees a partial result
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(result, f)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+
+class TaskJournal(object):
+    DONE = "done"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+    def __init__(self, path):
+        """A TaskJournal is an append-only record of the outcome of each task, so a job that
+        died part way through can resume with the tasks that did not finish.
+
+        Every record is one JSON line with the task index, its status and how long it took.
+        Only one rank (the write rank) should record; the file is opened per record and
+        synced, so a crash loses at most the record being written. The last record of a
+        task wins, so a task that failed and was retried later shows up as done.
+
+        Args:
+            path: the journal file. created on the first record.
+        """
+        self.path = path
+
+    def record(self, index, status, elapsed, error=None):
+        """Appends the status (DONE, FAILED or SKIPPED) of task index."""
+        entry = {"task": index, "status": status, "elapsed": round(elapsed, 6)}
+        entry["time"] = time.time()
+        if error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}"
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def statuses(self):
+        """Returns a dict with the last recorded status of each task index."""
+        statuses = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a partial line left by a crash
+                        continue
+                    statuses[entry["task"]] = entry["status"]
+        except FileNotFoundError:
+            pass
+        return statuses
+
+    def remaining(self, tasks, retry_failed=False):
+        """Returns the tasks that still need to run.
+
+        Args:
+            tasks: all task indices of the job, in order.
+            retry_failed: only return the tasks recorded as failed or skipped, instead of
+                every task that is not done.
+        """
+        statuses = self.statuses()
+        if retry_failed:
+            retry = (TaskJournal.FAILED, TaskJournal.SKIPPED)
+            return [i for i in tasks if statuses.get(i) in retry]
+        return [i for i in tasks if statuses.get(i) != TaskJournal.DONE]
+
+
+class RetryPolicy(object):
+    STAGES = ("read", "process", "write")
+
+    def __init__(self, attempts=None, backoff=0.1, max_backoff=10.0, retryable=(OSError,)):
+        """A RetryPolicy decides whether a failed task is tried again. A task is requeued when
+        the error of the stage that failed is retryable and the stage has attempts left, after
+        an exponential backoff.
+
+        Failed tasks are not retried inline, which would stall the pipeline behind them, but
+        requeued to another pass over the failed tasks. The write rank sees the outcome of
+        every task, so it alone counts the failures and decides. The other stages hand their
+        errors downstream as a StageError, which carries the stage and whether the error is
+        retryable. At the end of a pass, the write rank broadcasts the requeued tasks once,
+        so all ranks agree on the next pass.
+
+        Args:
+            attempts: a dict with the maximum number of attempts of each stage in STAGES.
+                missing stages get a single attempt.
+            backoff: the seconds to wait before the first retry of a task, doubled for every
+                further retry of the same task.
+            max_backoff: the longest wait before a retry.
+            retryable: a tuple of exception types that are worth retrying, or a function
+                that takes an error and returns True if it is.
+        """
+        self.attempts = dict.fromkeys(RetryPolicy.STAGES, 1)
+        self.attempts.update(attempts or {})
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retryable = retryable
+        self._failures = {}
+
+    def is_retryable(self, error):
+        """Returns True if error, or an error it was raised from, is retryable."""
+        classify = self.retryable
+        if isinstance(classify, tuple):
+            classify = lambda e: isinstance(e, self.retryable)
+        while error is not None:
+            if classify(error):
+                return True
+            error = error.__cause__
+        return False
+
+    def retry(self, index, stage, retryable):
+        """Counts a failure of task index in stage. Call it on the rank that decides.
+
+        Returns:
+            delay: the seconds to wait before retrying the task, or None if it should not be
+                retried.
+        """
+        failures = self._failures.setdefault(index, dict.fromkeys(RetryPolicy.STAGES, 0))
+        failures[stage] += 1
+        if not retryable or failures[stage] >= self.attempts[stage]:
+            return None
+        retries = sum(failures.values())
+        return min(self.backoff * 2 ** (retries - 1), self.max_backoff)
+
+    def stage_error(self, stage, error):
+        """Returns a StageError for error, classified where its causes are still known."""
+        return StageError(stage, self.is_retryable(error), error)
+
+
+class StageError(RuntimeError):
+    def __init__(self, stage, retryable, error):
+        """The error of a task that failed in stage, as handed to the write rank in place of
+        the task's result. Errors lose their causes when they are pickled, so the stage and
+        whether the error is retryable travel as plain values, with the message of the error
+        that started it.
+
+        Args:
+            stage: the stage in RetryPolicy.STAGES that failed.
+            retryable: True if the error is worth another attempt.
+            error: the exception, or its message.
+        """
+        if isinstance(error, Exception):
+            # report the error that started it rather than the wrappers around it
+            while error.__cause__ is not None:
+                error = error.__cause__
+            error = f"{type(error).__name__}: {error}"
+        super().__init__(stage, retryable, error)
+        self.stage = stage
+        self.retryable = retryable
+
+    def __str__(self):
+        return f"failed to {self.stage}: {self.args[2]}"
 
 
 class MyModule(object):
-    def __init__(self, rank, size, index, args):
+    def __init__(self, rank, size, index, args, attempt=0):
         self.rank = rank
         self.size = size
         self.index = index
+        self.attempt = attempt
         self.trigger_one = args.trigger_one
         self.trigger_two = args.trigger_two
         self.trigger_three = args.trigger_three
+        self.trigger_transient = args.trigger_transient
 
     def msg(self, s):
         return f"{self.rank}: ({self.index}) {s}"
@@ -97,7 +1106,9 @@ class MyModule(object):
         time.sleep(0.5)
         if self.trigger_one and self.index == 1:
             raise RuntimeError(self.msg(f"error during load_data!"))
-        numbers = list(range((self.index*n), (self.index+1)*n))
+        if self.trigger_transient and self.index == 1 and self.attempt == 0:
+            raise OSError(self.msg(f"transient error during load_data!"))
+        numbers = np.arange(self.index*n, (self.index+1)*n)
         print(self.msg(f"numbers = {numbers}"))
         return numbers
 
@@ -105,18 +1116,15 @@ class MyModule(object):
         if self.trigger_two and self.index == 1:
             if self.rank == self.size - 1:
                 raise RuntimeError(self.msg(f"error during process_data!"))
-        subtotal = 0
-        for value in numbers:
-            time.sleep(0.05)
-            subtotal += value
+        time.sleep(0.05 * len(numbers))
+        subtotal = numbers.sum()
         print(self.msg(f"subtotal = {subtotal}"))
         return subtotal
 
-    def write_result(self, subtotals):
+    def write_result(self, total):
         time.sleep(0.5)
         if self.trigger_three and self.index == 1:
             raise RuntimeError(self.msg(f"error during write_result!"))
-        total = sum(subtotals)
         print(self.msg(f"total = {total}"))
 
 class NoMPIIOComm(object):
@@ -140,7 +1148,9 @@ class NoMPIIOComm(object):
     def read(self, func, data):
         return func()
 
-    def write(self, func, data):
+    def write(self, func, data, error=None):
+        if error is not None:
+            raise error
         func(data)
 
 class SyncIOComm(object):
@@ -167,24 +1177,22 @@ class SyncIOComm(object):
         return self.comm.rank == SyncIOComm.WORK_ROOT
 
     def read(self, func, data):
-        error = None
         if self.comm.rank == SyncIOComm.READ_RANK:
+            # the read rank is the worker root, the workers learn about an error in the
+            # first collective of the task
             try:
                 data = func()
             except Exception as e:
-                error = e
-
-        # check for error
-        error = self.comm.bcast(error, root=SyncIOComm.READ_RANK)
-        if error is not None:
-            # handle the error on all ranks
-            msg = f"{self.comm.rank}: caught during read!"
-            raise RuntimeError(msg) from error
+                msg = f"{self.comm.rank}: caught during read!"
+                raise RuntimeError(msg) from e
 
         return data
 
-    def write(self, func, data):
+    def write(self, func, data, error=None):
         if self.comm.rank == SyncIOComm.WRITE_RANK:
+            # the write rank is the worker root, so it already has the error
+            if error is not None:
+                raise error
             func(data)
 
 class AsyncIOComm(object):
@@ -231,6 +1239,9 @@ class AsyncIOComm(object):
 
         Returns: 
             data: either the provided default data or data returned by func on WORK_ROOT/READ_RANK
+
+        The error travels with the data in a single message, so only READ_RANK and WORK_ROOT
+        raise it. The other workers learn about it in the first collective of the task.
         """
         error = None
         if self.comm.rank == AsyncIOComm.READ_RANK:
@@ -238,44 +1249,38 @@ class AsyncIOComm(object):
                 data = func()
             except Exception as e:
                 error = e
-            # self.comm.send(error, dest=AsyncIOComm.WORK_ROOT, tag=0)
+            self.comm.send((error, data), dest=AsyncIOComm.WORK_ROOT, tag=1)
+        elif self.comm.rank == AsyncIOComm.WORK_ROOT:
+            error, data = self.comm.recv(source=AsyncIOComm.READ_RANK, tag=1)
+        else:
+            pass
 
-        # check for error
-        error = self.comm.bcast(error, root=AsyncIOComm.READ_RANK)
-        # handle the error on all ranks
         if error is not None:
             msg = f"{self.comm.rank}: caught during read!"
             raise RuntimeError(msg) from error
 
-        if self.comm.rank == AsyncIOComm.READ_RANK:
-            self.comm.send(data, dest=AsyncIOComm.WORK_ROOT, tag=1)
-        elif self.comm.rank == AsyncIOComm.WORK_ROOT:
-            data = self.comm.recv(source=AsyncIOComm.READ_RANK, tag=1)
-        else:
-            pass
-
         return data
 
-    def write(self, func, data):
+    def write(self, func, data, error=None):
         """WORK_ROOT sends `data` to WRITE_RANK. WRITE_RANK calls `func` to
         write `data`. This is a no-op for all other ranks.
 
+        The error travels with the data in a single message, so a failed task
+        costs the write rank no more than a successful one. If WORK_ROOT passes
+        an error, WRITE_RANK raises it instead of writing.
+
         Args:
             func (method): function that writes `data`.
             data: the data to be written by `func`.
+            error: on WORK_ROOT, the error that failed the task, or None.
         """
 
-        if self.comm.rank == AsyncIOComm.WRITE_RANK:
-            error = self.comm.recv(source=AsyncIOComm.WORK_ROOT, tag=0)
-            if error is not None:
-                raise error
-        else:
-            pass
-
         if self.comm.rank == AsyncIOComm.WORK_ROOT:
-            self.comm.send(data, dest=AsyncIOComm.WRITE_RANK, tag=2)
+            self.comm.send((error, data), dest=AsyncIOComm.WRITE_RANK, tag=2)
         elif self.comm.rank == AsyncIOComm.WRITE_RANK:
-            data = self.comm.recv(source=AsyncIOComm.WORK_ROOT, tag=2)
+            error, data = self.comm.recv(source=AsyncIOComm.WORK_ROOT, tag=2)
+            if error is not None:
+                raise error
             func(data)
         else:
             pass
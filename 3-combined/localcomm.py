@@ -0,0 +1,257 @@
+"""A stand-in for an MPI communicator backed by local processes.
+
+launch(nprocs, func, *args) starts nprocs processes with multiprocessing and calls
+func(comm, *args) in each of them, where comm is a LocalComm playing the role of
+MPI.COMM_WORLD. LocalComm provides the subset of the mpi4py communicator interface used
+by the helpers in this directory, so SafeMPIComm, SyncIOComm and AsyncIOComm wrap it
+unchanged and the mpi code paths run on all local cores without an MPI installation. It
+covers the helpers of this directory only: the 2-async-io coordinators also use buffer
+point-to-point calls, Gatherv, shared-memory windows, improbe and Get_attr, which LocalComm
+does not provide.
+
+Every process owns one inbox queue. A message carries the context of the communicator it
+was sent on, its source and its tag, so messages on different communicators never match.
+Collectives are built from point-to-point messages on a separate context. The nonblocking
+SafeMPIComm variants need mpi4py and are not supported.
+"""
+
+import multiprocessing
+from multiprocessing.connection import wait
+
+
+class Request(object):
+    def __init__(self, obj=None):
+        """A request for an operation that is already complete."""
+        self.obj = obj
+
+    def wait(self):
+        return self.obj
+
+    def test(self):
+        return True, self.obj
+
+    def Wait(self):
+        pass
+
+    def Test(self):
+        return True
+
+
+class LocalGroup(object):
+    def __init__(self, ranks):
+        """An ordered set of world ranks, similar to an MPI group."""
+        self.ranks = list(ranks)
+
+    def Excl(self, ranks):
+        exclude = [self.ranks[rank] for rank in ranks]
+        return LocalGroup([rank for rank in self.ranks if rank not in exclude])
+
+    def Incl(self, ranks):
+        return LocalGroup([self.ranks[rank] for rank in ranks])
+
+
+class Mailbox(object):
+    def __init__(self, inboxes, rank):
+        """Matches incoming messages for one process. Messages that arrive before they are
+        requested are kept until a matching receive.
+        """
+        self.inboxes = inboxes
+        self.inbox = inboxes[rank]
+        self.rank = rank
+        self.pending = []
+
+    def put(self, dest, context, source, tag, obj):
+        self.inboxes[dest].put((context, source, tag, obj))
+
+    def get(self, context, source, tag):
+        def match(message):
+            return (
+                message[0] == context
+                and (source is None or message[1] == source)
+                and (tag is None or message[2] == tag)
+            )
+
+        for i, message in enumerate(self.pending):
+            if match(message):
+                return self.pending.pop(i)
+        while True:
+            message = self.inbox.get()
+            if match(message):
+                return message
+            self.pending.append(message)
+
+
+class LocalComm(object):
+    def __init__(self, mailbox, ranks, context):
+        """A communicator between the local processes with the given world ranks.
+
+        Args:
+            mailbox: the Mailbox of this process.
+            ranks: the world rank of each rank in this communicator.
+            context: a hashable value that is unique to this communicator.
+        """
+        self._mailbox = mailbox
+        self._ranks = list(ranks)
+        self._context = context
+        self._nsplits = 0
+        self._ngroups = 0
+        self.rank = self._ranks.index(mailbox.rank)
+        self.size = len(self._ranks)
+
+    @property
+    def group(self):
+        return LocalGroup(self._ranks)
+
+    # point-to-point
+
+    def send(self, obj, dest, tag=0):
+        self._put(obj, dest, tag, self._context)
+
+    def isend(self, obj, dest, tag=0):
+        self.send(obj, dest, tag)
+        return Request()
+
+    def recv(self, buf=None, source=None, tag=None):
+        """Receives a message. source=None and tag=None match any source and any tag."""
+        return self._get(source, tag, self._context)
+
+    def _put(self, obj, dest, tag, context):
+        self._mailbox.put(self._ranks[dest], context, self._ranks[self.rank], tag, obj)
+
+    def _get(self, source, tag, context):
+        world_source = None if source is None else self._ranks[source]
+        return self._mailbox.get(context, world_source, tag)[3]
+
+    # collectives
+
+    def bcast(self, obj, root=0):
+        context = (self._context, "bcast")
+        if self.rank == root:
+            for rank in range(self.size):
+                if rank != root:
+                    self._put(obj, rank, 0, context)
+            return obj
+        return self._get(root, 0, context)
+
+    def Bcast(self, buf, root=0):
+        """Broadcasts a buffer from root, like MPI Bcast."""
+        view = memoryview(buf).cast("B")
+        data = self.bcast(view.tobytes() if self.rank == root else None, root=root)
+        view[:] = data
+
+    def scatter(self, sendobj, root=0):
+        context = (self._context, "scatter")
+        if self.rank == root:
+            for rank in range(self.size):
+                if rank != root:
+                    self._put(sendobj[rank], rank, 0, context)
+            return sendobj[root]
+        return self._get(root, 0, context)
+
+    def gather(self, sendobj, root=0):
+        context = (self._context, "gather")
+        if self.rank != root:
+            self._put(sendobj, root, 0, context)
+            return None
+        return [
+            sendobj if rank == root else self._get(rank, 0, context)
+            for rank in range(self.size)
+        ]
+
+    def Scatterv(self, sendbuf, recvbuf, root=0):
+        """Scatters a [buffer, (counts, displs)] send buffer from root into recvbuf."""
+        chunks = None
+        if self.rank == root:
+            buf, (counts, displs) = sendbuf
+            chunks = [buf[d : d + c] for c, d in zip(counts, displs)]
+        memoryview(recvbuf).cast("B")[:] = memoryview(self.scatter(chunks, root)).cast("B")
+
+    def allgather(self, sendobj):
+        return self.bcast(self.gather(sendobj, root=0), root=0)
+
+    def Reduce(self, sendbuf, recvbuf, root=0):
+        """Sums buffers elementwise onto root, like the default op of MPI Reduce."""
+        values = self.gather(_flat(sendbuf).tolist(), root=root)
+        if values is not None:
+            result = _flat(recvbuf)
+            for i, total in enumerate(map(sum, zip(*values))):
+                result[i] = total
+
+    def Allreduce(self, sendbuf, recvbuf):
+        """Sums buffers elementwise, like the default op of MPI Allreduce."""
+        values = self.allgather(_flat(sendbuf).tolist())
+        result = _flat(recvbuf)
+        for i, total in enumerate(map(sum, zip(*values))):
+            result[i] = total
+
+    def barrier(self):
+        self.allgather(None)
+
+    def Barrier(self):
+        self.barrier()
+
+    # communicator management
+
+    def Split(self, color, key=0):
+        members = self.allgather((color, key, self.rank))
+        self._nsplits += 1
+        ranks = sorted((k, rank) for c, k, rank in members if c == color)
+        ranks = [self._ranks[rank] for k, rank in ranks]
+        return LocalComm(self._mailbox, ranks, (self._context, "split", self._nsplits, color))
+
+    def Split_type(self, split_type, key=0, info=None):
+        """Splits by shared memory, like MPI Split_type. All local processes share one node."""
+        return self.Split(0, key=key)
+
+    def Create_group(self, group, tag=0):
+        """Creates a communicator for the ranks in group. Only members of group call this."""
+        self._ngroups += 1
+        context = (self._context, "group", self._ngroups, tag, tuple(group.ranks))
+        return LocalComm(self._mailbox, group.ranks, context)
+
+    def Free(self):
+        pass
+
+
+def _flat(buf):
+    """Returns a one-dimensional memoryview of a contiguous buffer with its item format."""
+    view = memoryview(buf)
+    return view.cast("B").cast(view.format)
+
+
+def _bootstrap(inboxes, rank, func, args):
+    mailbox = Mailbox(inboxes, rank)
+    func(LocalComm(mailbox, range(len(inboxes)), "world"), *args)
+
+
+def launch(nprocs, func, *args):
+    """Runs func(comm, *args) in nprocs local processes, where comm is a LocalComm spanning
+    all of them. If a process fails, the remaining processes are terminated.
+
+    Args:
+        nprocs: the number of processes.
+        func: a picklable callable taking a communicator and args.
+        args: additional picklable arguments passed to func.
+
+    Returns:
+        exitcode: 0 if all processes succeeded, otherwise the first nonzero exit code.
+    """
+    inboxes = [multiprocessing.Queue() for rank in range(nprocs)]
+    processes = [
+        multiprocessing.Process(target=_bootstrap, args=(inboxes, rank, func, args))
+        for rank in range(nprocs)
+    ]
+    for process in processes:
+        process.start()
+    running = list(processes)
+    exitcode = 0
+    while running:
+        for sentinel in wait([process.sentinel for process in running]):
+            process = next(p for p in running if p.sentinel == sentinel)
+            process.join()
+            running.remove(process)
+            if process.exitcode != 0 and exitcode == 0:
+                exitcode = process.exitcode
+                for other in running:
+                    other.terminate()
+    return exitcode
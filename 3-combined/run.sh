@@ -2,6 +2,10 @@
 
 set -e
 
+# scratch space for the cache and journal demos, so reruns start from a clean state
+scratch=$(mktemp -d)
+trap 'rm -rf "$scratch"' EXIT
+
 printf "\n### Part a\n"
 cmd="python ex3-combined.py"
 printf "> $cmd\n"
@@ -47,3 +51,47 @@ cmd="mpiexec -n 4 python ex3-combined.py --mpi --async-io --trigger-three"
 printf "> $cmd\n"
 $cmd
 
+printf "\n"
+cmd="python ex3-combined.py --local 4 --async-io --trigger-two"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 6 python ex3-combined.py --mpi --async-io --hierarchical --ranks-per-node 2"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 8 python bench-collectives.py --mpi --ranks-per-node 4"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 4 python ex3-combined.py --mpi --async-io --trigger-three --cache $scratch/cache"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 4 python ex3-combined.py --mpi --async-io --cache $scratch/cache"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 4 python ex3-combined.py --mpi --async-io --trigger-two --journal $scratch/journal.jsonl"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 4 python ex3-combined.py --mpi --async-io --retry-failed --journal $scratch/journal.jsonl"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 4 python ex3-combined.py --mpi --async-io --trigger-transient --read-attempts 3"
+printf "> $cmd\n"
+$cmd
+
+printf "\n"
+cmd="mpiexec -n 4 python ex3-combined.py --mpi --async-io --ntasks 8 --batch-size 4 --trigger-two"
+printf "> $cmd\n"
+$cmd